@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TextIO
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 1.0
+# Envelopes waiting for the writer thread; beyond this (disk stalled or failing) they are dropped.
+MAX_QUEUED_ENVELOPES = 10_000
+
+
+class WebhookCapture:
+    """Appends raw webhook envelopes with arrival timestamps to rotating gzipped JSONL files.
+
+    `write` only queues the envelope; a background thread does the gzip work so the webhook never
+    blocks on disk. The file is flushed when it rotates and at most every FLUSH_INTERVAL_SECONDS.
+    File names carry the pid so several uvicorn workers never append to the same file.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[tuple[float, bytes | dict] | None] = queue.Queue(MAX_QUEUED_ENVELOPES)
+        self.dropped = 0
+        self._thread: threading.Thread | None = None
+        self._handle: TextIO | None = None
+        self._written = 0
+        self._sequence = itertools.count(1)
+
+    def _open(self) -> TextIO:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        path = self.directory / f"webhook-{stamp}-{os.getpid()}-{next(self._sequence):04d}.jsonl.gz"
+        self._written = 0
+        return gzip.open(path, "at", encoding="utf-8")
+
+    def write(self, body: bytes | dict, arrived_at: float | None = None) -> None:
+        """Queue a raw request body (or an already decoded envelope) for the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="webhook-capture", daemon=True)
+                self._thread.start()
+            try:
+                self._queue.put_nowait((arrived_at or time.time(), body))
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped % 1000 == 1:
+                    logger.warning("webhook capture queue full; %d envelopes dropped", self.dropped)
+
+    def _append(self, arrived_at: float, body: bytes | dict) -> None:
+        if isinstance(body, bytes):
+            body = json.loads(body)
+        line = json.dumps({"t": arrived_at, "body": body}, separators=(",", ":")) + "\n"
+        if self._handle is None or self._written >= self.max_bytes:
+            self._close_handle()
+            self._handle = self._open()
+        self._handle.write(line)
+        self._written += len(line)
+
+    def _run(self) -> None:
+        flushed_at = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL_SECONDS)
+            except queue.Empty:
+                item = ()  # idle; fall through so buffered lines still get flushed
+            if item is None:
+                break
+            try:
+                if item:
+                    self._append(*item)
+                if self._handle is not None and time.monotonic() - flushed_at >= FLUSH_INTERVAL_SECONDS:
+                    self._handle.flush()
+                    flushed_at = time.monotonic()
+            except Exception:
+                # Disk full, bad JSON, ...: lose this envelope, not the thread; the next one opens a new file.
+                logger.exception("webhook capture write failed")
+                self._discard_handle()
+        self._close_handle()
+
+    def _close_handle(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _discard_handle(self) -> None:
+        try:
+            self._close_handle()
+        except OSError:
+            self._handle = None
+
+    def close(self) -> None:
+        """Write out everything queued so far and close the current file."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is not None:
+                self._queue.put(None)
+                thread.join()
+
+
+_capture: WebhookCapture | None = None
+
+
+def webhook_capture() -> WebhookCapture | None:
+    global _capture
+    if not settings.webhook_capture_dir:
+        return None
+    if _capture is None or _capture.directory != Path(settings.webhook_capture_dir):
+        if _capture is not None:
+            _capture.close()
+        _capture = WebhookCapture(settings.webhook_capture_dir, settings.webhook_capture_max_bytes)
+    return _capture
+
+
+def close_webhook_capture() -> None:
+    if _capture is not None:
+        _capture.close()
+
+
+def _read_capture(path: str) -> Iterator[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_captures(paths: Iterable[str]) -> Iterator[dict]:
+    """Records from all files in arrival order; files from different worker processes interleave."""
+    yield from heapq.merge(*(_read_capture(path) for path in sorted(paths)), key=lambda record: record["t"])
@@ -30,12 +30,45 @@ class Settings(BaseSettings):
     whatsapp_phone_number_id_file: str | None = None
 
     outbound_reply_enabled: bool = False
+    whatsapp_stub: bool = False
+    whatsapp_stub_latency_ms: int = 0
     require_invoke_prefix: bool = True
     invoke_prefixes: str = "michael:,@michael,/ask"
     freeform_window_hours: int = 24
+    template_registry_file: str | None = None
+    template_default_language: str = "en_US"
+    out_of_window_template: str = "out_of_window_default"
+    rule_cache_ttl_seconds: int = 60
+    rule_snapshot_file: str | None = None
+    rule_candidate_filter_min_rules: int = 0
+    admin_bulk_chunk_size: int = 500
+    webhook_invoke_filter: bool = False
+    webhook_capture_dir: str | None = None
+    webhook_capture_max_bytes: int = 64 * 1024 * 1024
 
     queue_poll_timeout_seconds: int = 2
     queue_max_attempts: int = 5
+    worker_outbound_batch_size: int = 1
+    queue_depth_check_interval_seconds: float = 1.0
+    queue_spool_high_water: int = 0
+    queue_shed_high_water: int = 0
+    queue_shed_retry_after_seconds: int = 30
+    outbound_lease_seconds: int = 120
+    outbound_sweep_interval_seconds: int = 60
+    outbound_sweep_batch_size: int = 500
+
+    job_trace_enabled: bool = False
+    job_slow_threshold_ms: int = 500
+    job_profile_sample_rate: int = 0
+    job_profile_dir: str = "profiles"
+
+    retention_interval_seconds: int = 3600
+    retention_batch_size: int = 1000
+    retention_inbound_dedup_days: int = 7
+    retention_outbound_sends_days: int = 30
+    retention_conversation_turns_days: int = 90
+    retention_pending_delivery_statuses_days: int = 1
+    retention_export_dir: str | None = None
 
     model_config = SettingsConfigDict(env_file=".env", env_prefix="MICAI_")
 
@@ -2,27 +2,48 @@ from __future__ import annotations
 
 from collections.abc import Iterator
 from contextlib import contextmanager
+from functools import lru_cache
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import Session, sessionmaker
 
 from app.config import settings
-from app.db_models import Base
+from app.profiling import trace_phase
 
-engine = create_engine(settings.database_url, future=True)
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    return create_engine(settings.database_url, future=True)
+
+
+@lru_cache(maxsize=None)
+def get_sessionmaker() -> sessionmaker[Session]:
+    return sessionmaker(bind=get_engine(), autoflush=False, autocommit=False, future=True)
+
+
+def __getattr__(name: str) -> object:
+    # `engine` and `SessionLocal` are created on first access so importing this module stays cheap.
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def init_db() -> None:
-    Base.metadata.create_all(bind=engine)
+    from app.db_models import Base
+
+    Base.metadata.create_all(bind=get_engine())
 
 
 @contextmanager
 def session_scope() -> Iterator[Session]:
-    session = SessionLocal()
+    with trace_phase("session_open"):
+        session = get_sessionmaker()()
     try:
         yield session
-        session.commit()
+        with trace_phase("commit"):
+            session.commit()
     except Exception:
         session.rollback()
         raise
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, Integer, String, Text, func
+from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -18,12 +18,29 @@ class AgentRuleRow(Base):
     rule_type: Mapped[str] = mapped_column(String(32))
     enabled: Mapped[bool] = mapped_column(Boolean, default=True)
     priority: Mapped[int] = mapped_column(Integer, default=100)
+    # Legacy pipe-joined keywords; `python -m app.migrate` moves them into agent_rule_keywords.
     keywords_csv: Mapped[str] = mapped_column(Text, default="")
     prefix: Mapped[str | None] = mapped_column(String(128), nullable=True)
     action: Mapped[str] = mapped_column(String(32), default="reply_text")
     reply_text: Mapped[str] = mapped_column(Text, default="")
 
 
+class AgentRuleKeywordRow(Base):
+    __tablename__ = "agent_rule_keywords"
+
+    rule_id: Mapped[str] = mapped_column(
+        String(64), ForeignKey("agent_rules.id", ondelete="CASCADE"), primary_key=True
+    )
+    keyword: Mapped[str] = mapped_column(String(256), primary_key=True, index=True)
+
+
+class AgentSettingsRow(Base):
+    __tablename__ = "agent_settings"
+
+    agent_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    invoke_prefixes: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+
 class UserAgentBindingRow(Base):
     __tablename__ = "user_agent_bindings"
 
@@ -41,7 +58,9 @@ class ConversationTurnRow(Base):
     inbound_text: Mapped[str] = mapped_column(Text)
     outbound_text: Mapped[str] = mapped_column(Text)
     matched_rule_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
 
 
 class InboundDedupRow(Base):
@@ -50,7 +69,9 @@ class InboundDedupRow(Base):
     message_id: Mapped[str] = mapped_column(String(128), primary_key=True)
     wa_id: Mapped[str] = mapped_column(String(64), index=True)
     text: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
 
 
 class OutboundSendRow(Base):
@@ -60,16 +81,35 @@ class OutboundSendRow(Base):
     wa_id: Mapped[str] = mapped_column(String(64), index=True)
     body: Mapped[str] = mapped_column(Text, default="")
     template_name: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    template_language: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    template_parameters_json: Mapped[str] = mapped_column(Text, default="[]")
     status: Mapped[str] = mapped_column(String(24), default="pending")
     attempts: Mapped[int] = mapped_column(Integer, default=0)
-    provider_message_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # A "sending" row belongs to the worker that claimed it until this passes; then it may be reclaimed.
+    lease_expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    provider_message_id: Mapped[str | None] = mapped_column(String(128), nullable=True, unique=True, index=True)
     last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
 
+class PendingDeliveryStatusRow(Base):
+    """A delivery status that arrived before the worker recorded the provider message id."""
+
+    __tablename__ = "pending_delivery_statuses"
+
+    provider_message_id: Mapped[str] = mapped_column(String(128), primary_key=True)
+    status: Mapped[str] = mapped_column(String(24))
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), index=True
+    )
+
+
 class ScheduleRow(Base):
     __tablename__ = "schedules"
 
@@ -78,6 +118,8 @@ class ScheduleRow(Base):
     agent_id: Mapped[str] = mapped_column(String(64), index=True)
     message_text: Mapped[str] = mapped_column(Text)
     template_name: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    template_language: Mapped[str | None] = mapped_column(String(16), nullable=True)
+    template_parameters_json: Mapped[str] = mapped_column(Text, default="[]")
     interval_minutes: Mapped[int] = mapped_column(Integer)
     next_run_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
     enabled: Mapped[bool] = mapped_column(Boolean, default=True)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from app.config import settings
+from app.models import DeliveryStatus, IncomingMessage, WebhookEnvelope
+from app.queue import JobQueue
+from app.repository import Repository
+from app.rule_cache import rule_cache
+from app.rules import normalize
+
+SPOOL_JOB_TYPE = "spool.webhook_envelope"
+
+
+def extract_messages(envelope: WebhookEnvelope) -> list[IncomingMessage]:
+    messages: list[IncomingMessage] = []
+    for entry in envelope.entry:
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            contacts = value.get("contacts", [])
+            default_wa_id = contacts[0].get("wa_id") if contacts else ""
+
+            for msg in value.get("messages", []):
+                message_type = msg.get("type", "")
+                wa_id = default_wa_id or msg.get("from", "")
+                text = ""
+                if message_type == "text":
+                    text = msg.get("text", {}).get("body", "")
+                elif message_type == "audio":
+                    text = "voice note"
+
+                if not wa_id:
+                    continue
+
+                messages.append(
+                    IncomingMessage(
+                        message_id=msg.get("id", ""),
+                        wa_id=wa_id,
+                        text=text,
+                        is_voice=message_type == "audio",
+                    )
+                )
+    return [m for m in messages if m.message_id and m.text]
+
+
+def extract_statuses(envelope: WebhookEnvelope) -> list[DeliveryStatus]:
+    statuses: list[DeliveryStatus] = []
+    for entry in envelope.entry:
+        for change in entry.get("changes", []):
+            for item in change.get("value", {}).get("statuses", []):
+                provider_message_id = item.get("id", "")
+                if not provider_message_id:
+                    continue
+                errors = item.get("errors") or []
+                error = None
+                if errors:
+                    error = f"{errors[0].get('code', '')}: {errors[0].get('title', '')}".strip(": ")
+                statuses.append(
+                    DeliveryStatus(
+                        provider_message_id=provider_message_id,
+                        status=item.get("status", ""),
+                        error=error,
+                    )
+                )
+    return statuses
+
+
+def ingest_envelope(repo: Repository, queue: JobQueue, envelope: WebhookEnvelope) -> dict[str, int]:
+    """Claim and enqueue new messages, record uninvoked chatter and apply delivery statuses."""
+    processed = 0
+    duplicates = 0
+    uninvoked: list[str] = []
+    gate = None
+    if settings.require_invoke_prefix and settings.webhook_invoke_filter:
+        gate = rule_cache.any_gate(repo)
+    for message in extract_messages(envelope):
+        if gate is not None and not gate.matches(normalize(message.text)):
+            uninvoked.append(message.wa_id)
+            continue
+        claimed = repo.claim_inbound_message(message.message_id, message.wa_id, message.text)
+        if not claimed:
+            duplicates += 1
+            continue
+        queue.enqueue("inbound.process_message", message.model_dump())
+        processed += 1
+    repo.touch_users_inbound(uninvoked)
+    statuses = extract_statuses(envelope)
+    if statuses:
+        repo.apply_delivery_statuses(statuses)
+    return {
+        "processed": processed,
+        "uninvoked": len(uninvoked),
+        "duplicates": duplicates,
+        "statuses": len(statuses),
+    }
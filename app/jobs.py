@@ -1,27 +1,30 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import logging
+from dataclasses import dataclass, field
 
 from app.config import settings
 from app.models import ConversationTurn, IncomingMessage
+from app.profiling import trace_phase
 from app.queue import JobQueue
 from app.repository import Repository
-from app.rules import match_rule, normalize
+from app.rule_cache import rule_cache
+from app.rules import InvokeGate, match_rule, normalize
+from app.templates import TemplateError, template_registry
 from app.whatsapp import wa_client
 
+logger = logging.getLogger(__name__)
+
 
 def _fallback_reply(text: str) -> str:
     return f"I heard: {text}. I can help with weather or reminders."
 
 
-def _is_invoked(text: str) -> bool:
+def _is_invoked(normalized_text: str, gate: InvokeGate) -> bool:
     if not settings.require_invoke_prefix:
         return True
-    candidate = normalize(text)
-    for prefix in settings.invoke_prefixes.split(","):
-        if candidate.startswith(normalize(prefix)):
-            return True
-    return False
+    return gate.matches(normalized_text)
 
 
 @dataclass
@@ -30,16 +33,32 @@ class OutboundCommand:
     wa_id: str
     body: str
     template_name: str | None = None
+    template_language: str | None = None
+    template_parameters: list[str] = field(default_factory=list)
 
 
 def process_inbound_message(repo: Repository, queue: JobQueue, payload: dict) -> bool:
-    message = IncomingMessage.model_validate(payload)
+    with trace_phase("decode"):
+        message = IncomingMessage.model_validate(payload)
+        normalized = normalize(message.text)
     repo.touch_user_inbound(message.wa_id)
-    if not _is_invoked(message.text):
+    any_gate = rule_cache.any_gate(repo)
+    with trace_phase("match"):
+        invoked = _is_invoked(normalized, any_gate)
+    if not invoked:
+        return False
+
+    rule_set = rule_cache.get(repo, repo.get_agent_id_for_user(message.wa_id))
+    with trace_phase("match"):
+        invoked = _is_invoked(normalized, rule_set.gate)
+    if not invoked:
         return False
 
-    rules = repo.get_rules_for_user(message.wa_id)
-    matched_rule = match_rule(message.text, rules)
+    rules = rule_set.rules
+    if rule_set.candidate_filter:
+        rules = repo.get_candidate_rules(rule_set.agent_id, normalized)
+    with trace_phase("match"):
+        matched_rule = match_rule(message.text, rules, normalized=normalized)
     outbound = matched_rule.reply_text if matched_rule and matched_rule.reply_text else _fallback_reply(message.text)
 
     turn = ConversationTurn(
@@ -61,44 +80,135 @@ def process_inbound_message(repo: Repository, queue: JobQueue, payload: dict) ->
     return True
 
 
+def _plan_delivery(repo: Repository, command: OutboundCommand) -> tuple[str | None, str | None, list[str]]:
+    """Pick freeform text or a validated template; returns (template_name, language, parameters).
+
+    Raises TemplateError before any network call when the template cannot be sent.
+    """
+    if command.template_name:
+        name, parameters = command.template_name, command.template_parameters
+    elif repo.can_send_freeform(command.wa_id, settings.freeform_window_hours):
+        return None, None, []
+    else:
+        name, parameters = settings.out_of_window_template, []
+    language = template_registry().resolve(name, command.template_language, parameters)
+    return name, language, parameters
+
+
+async def _deliver(repo: Repository, command: OutboundCommand) -> str | None:
+    template_name, language, parameters = _plan_delivery(repo, command)
+    with trace_phase("send"):
+        if template_name is None:
+            return await wa_client.send_text(command.wa_id, command.body)
+        return await wa_client.send_template(
+            command.wa_id, template_name, language=language, parameters=parameters
+        )
+
+
 async def send_outbound_message(repo: Repository, payload: dict) -> bool:
-    command = OutboundCommand(**payload)
+    with trace_phase("decode"):
+        command = OutboundCommand(**payload)
     if not repo.try_start_outbound_send(
         idempotency_key=command.idempotency_key,
         wa_id=command.wa_id,
         body=command.body,
         template_name=command.template_name,
+        template_language=command.template_language,
+        template_parameters=command.template_parameters,
+        lease_seconds=settings.outbound_lease_seconds,
+        max_attempts=settings.queue_max_attempts,
     ):
         return False
+    # Commit the claim and its lease before the network call: if the worker dies mid-send the
+    # row stays "sending", retries are refused, and the sweeper requeues it once the lease expires.
+    repo.commit()
 
     try:
-        provider_id: str | None
-        if command.template_name:
-            provider_id = await wa_client.send_template(command.wa_id, command.template_name)
-        elif repo.can_send_freeform(command.wa_id, settings.freeform_window_hours):
-            provider_id = await wa_client.send_text(command.wa_id, command.body)
-        else:
-            provider_id = await wa_client.send_template(command.wa_id, "out_of_window_default")
-        repo.mark_outbound_sent(command.idempotency_key, provider_message_id=provider_id)
+        provider_id = await _deliver(repo, command)
+    except TemplateError as exc:
+        # Retrying cannot fix an unapproved template, so record it and drop the job.
+        repo.mark_outbound_failed(command.idempotency_key, str(exc))
+        return False
     except Exception as exc:
         repo.mark_outbound_failed(command.idempotency_key, str(exc))
+        # The caller's scope rolls back on the way out, so the failure needs its own commit.
+        repo.commit()
         raise
+    repo.mark_outbound_sent(command.idempotency_key, provider_message_id=provider_id)
     return True
 
 
+async def send_outbound_batch(repo: Repository, payloads: list[dict]) -> int:
+    with trace_phase("decode"):
+        commands = [OutboundCommand(**payload) for payload in payloads]
+    claimed = repo.try_start_outbound_sends(
+        [command.__dict__ for command in commands],
+        lease_seconds=settings.outbound_lease_seconds,
+        max_attempts=settings.queue_max_attempts,
+    )
+    # Commit the claims before any network call: a later failure must not roll them back, or a
+    # retry would send the same messages again.
+    repo.commit()
+    sent: dict[str, str | None] = {}
+    failed: dict[str, str] = {}
+    for command in commands:
+        key = command.idempotency_key
+        if key not in claimed or key in sent or key in failed:
+            continue
+        try:
+            sent[key] = await _deliver(repo, command)
+        except Exception as exc:
+            failed[key] = str(exc)
+    repo.mark_outbound_results(sent, failed)
+    return len(sent)
+
+
+def requeue_stuck_outbound_sends(repo: Repository, queue: JobQueue) -> int:
+    """Re-enqueue sends whose worker died between claiming and recording the result."""
+    # Also catches statuses parked while the matching send was committing concurrently.
+    repo.release_pending_delivery_statuses()
+    exhausted = repo.fail_exhausted_outbound_sends(max_attempts=settings.queue_max_attempts)
+    if exhausted:
+        logger.warning("gave up on %s outbound sends after %s attempts", exhausted, settings.queue_max_attempts)
+    rows = repo.requeue_expired_outbound_sends(
+        lease_seconds=settings.outbound_lease_seconds,
+        max_attempts=settings.queue_max_attempts,
+        limit=settings.outbound_sweep_batch_size,
+    )
+    for row in rows:
+        command = OutboundCommand(
+            idempotency_key=row.idempotency_key,
+            wa_id=row.wa_id,
+            body=row.body,
+            template_name=row.template_name,
+            template_language=row.template_language,
+            template_parameters=json.loads(row.template_parameters_json or "[]"),
+        )
+        queue.enqueue("outbound.send_text", command.__dict__)
+    return len(rows)
+
+
 def enqueue_due_schedules(repo: Repository, queue: JobQueue) -> int:
     due = repo.list_due_schedules()
     count = 0
     for schedule in due:
-        queue.enqueue(
-            "outbound.send_text",
-            OutboundCommand(
-                idempotency_key=f"schedule:{schedule.id}:{int(schedule.next_run_at.timestamp())}",
-                wa_id=schedule.wa_id,
-                body=schedule.message_text,
-                template_name=schedule.template_name,
-            ).__dict__,
+        command = OutboundCommand(
+            idempotency_key=f"schedule:{schedule.id}:{int(schedule.next_run_at.timestamp())}",
+            wa_id=schedule.wa_id,
+            body=schedule.message_text,
+            template_name=schedule.template_name,
+            template_language=schedule.template_language,
+            template_parameters=json.loads(schedule.template_parameters_json or "[]"),
         )
         repo.advance_schedule(schedule)
+        if command.template_name:
+            try:
+                template_registry().resolve(
+                    command.template_name, command.template_language, command.template_parameters
+                )
+            except TemplateError as exc:
+                logger.warning("skipping schedule %s: %s", schedule.id, exc)
+                continue
+        queue.enqueue("outbound.send_text", command.__dict__)
         count += 1
     return count
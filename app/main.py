@@ -1,10 +1,20 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, Header, HTTPException, Query
+import json
+from collections.abc import AsyncIterator, Callable
 
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.capture import close_webhook_capture, webhook_capture
 from app.config import settings
-from app.models import AgentRule, IncomingMessage, WebhookEnvelope
+from app.ingest import SPOOL_JOB_TYPE, ingest_envelope
+from app.models import AgentRule, AgentSettings, UserAgentBinding, WebhookEnvelope
+from app.repository import Repository
+from app.rule_cache import rule_cache
 from app.runtime import runtime
+from app.snapshot import build_snapshot, write_snapshot
 
 app = FastAPI(title="mic.ai WhatsApp MVP", version="0.1.0")
 
@@ -12,37 +22,12 @@ app = FastAPI(title="mic.ai WhatsApp MVP", version="0.1.0")
 @app.on_event("startup")
 async def startup_event() -> None:
     runtime.initialize()
+    rule_cache.redis = runtime.redis
 
 
-def _extract_messages(envelope: WebhookEnvelope) -> list[IncomingMessage]:
-    messages: list[IncomingMessage] = []
-    for entry in envelope.entry:
-        for change in entry.get("changes", []):
-            value = change.get("value", {})
-            contacts = value.get("contacts", [])
-            default_wa_id = contacts[0].get("wa_id") if contacts else ""
-
-            for msg in value.get("messages", []):
-                message_type = msg.get("type", "")
-                wa_id = default_wa_id or msg.get("from", "")
-                text = ""
-                if message_type == "text":
-                    text = msg.get("text", {}).get("body", "")
-                elif message_type == "audio":
-                    text = "voice note"
-
-                if not wa_id:
-                    continue
-
-                messages.append(
-                    IncomingMessage(
-                        message_id=msg.get("id", ""),
-                        wa_id=wa_id,
-                        text=text,
-                        is_voice=message_type == "audio",
-                    )
-                )
-    return [m for m in messages if m.message_id and m.text]
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    close_webhook_capture()
 
 
 @app.get("/health")
@@ -62,16 +47,36 @@ async def verify_webhook(
 
 
 @app.post("/webhook")
-async def inbound_webhook(envelope: WebhookEnvelope) -> dict[str, int | str]:
-    processed = 0
+async def inbound_webhook(envelope: WebhookEnvelope, request: Request) -> dict[str, int | str]:
+    capture = webhook_capture()
+    if capture is not None:
+        # The raw body keeps top-level fields WebhookEnvelope does not model.
+        capture.write(await request.body())
+    mode = runtime.queue_monitor.mode(runtime.queue)
+    if mode == "shed":
+        raise HTTPException(
+            status_code=503,
+            detail="Queue over capacity",
+            headers={"Retry-After": str(settings.queue_shed_retry_after_seconds)},
+        )
+    if mode == "spool":
+        runtime.queue.enqueue(SPOOL_JOB_TYPE, envelope.model_dump())
+        return {"status": "spooled", "processed": 0, "uninvoked": 0, "duplicates": 0, "statuses": 0}
+
     with runtime.repo_scope() as repo:
-        for message in _extract_messages(envelope):
-            claimed = repo.claim_inbound_message(message.message_id, message.wa_id, message.text)
-            if not claimed:
-                continue
-            runtime.queue.enqueue("inbound.process_message", message.model_dump())
-            processed += 1
-    return {"status": "accepted", "processed": processed}
+        result = ingest_envelope(repo, runtime.queue, envelope)
+    return {"status": "accepted", **result}
+
+
+@app.get("/health/queue")
+async def queue_health() -> dict[str, object]:
+    lanes = runtime.queue_monitor.stats(runtime.queue)
+    return {
+        "mode": runtime.queue_monitor.mode(runtime.queue),
+        "depth": sum(lane["depth"] for lane in lanes.values()),
+        "oldest_age_seconds": max((lane["oldest_age_seconds"] for lane in lanes.values()), default=0.0),
+        "lanes": lanes,
+    }
 
 
 def _require_admin_key(key: str | None) -> None:
@@ -83,10 +88,120 @@ def _require_admin_key(key: str | None) -> None:
 async def upsert_rule(rule: AgentRule, x_admin_key: str | None = Header(default=None)) -> dict[str, str]:
     _require_admin_key(x_admin_key)
     with runtime.repo_scope() as repo:
-        repo.upsert_rule(rule)
+        changed = repo.upsert_rule(rule)
+    rule_cache.bump(changed)
     return {"status": "ok", "rule_id": rule.id}
 
 
+async def _iter_bulk_items(request: Request) -> AsyncIterator[tuple[int, bytes | object]]:
+    """Yield (index, item) from an NDJSON stream or a JSON array body."""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" not in content_type and "jsonl" not in content_type:
+        try:
+            items = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON") from None
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        for index, item in enumerate(items):
+            yield index, item
+        return
+
+    index = 0
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield index, line
+                index += 1
+    if buffer.strip():
+        yield index, buffer
+
+
+def _apply_chunk(
+    chunk: list[tuple[int, BaseModel]],
+    upsert: Callable[[Repository, list], None],
+    errors: list[dict[str, int | str]],
+) -> list:
+    if not chunk:
+        return []
+    items = [item for _, item in chunk]
+    try:
+        with runtime.repo_scope() as repo:
+            upsert(repo, items)
+    except SQLAlchemyError as exc:
+        message = str(getattr(exc, "orig", None) or exc).splitlines()[0]
+        errors.extend({"index": index, "error": message} for index, _ in chunk)
+        return []
+    return items
+
+
+async def _bulk_upsert(
+    request: Request, model: type[BaseModel], upsert: Callable[[Repository, list], None]
+) -> tuple[list, list[dict[str, int | str]]]:
+    applied: list = []
+    errors: list[dict[str, int | str]] = []
+    chunk: list[tuple[int, BaseModel]] = []
+    async for index, raw in _iter_bulk_items(request):
+        try:
+            item = model.model_validate_json(raw) if isinstance(raw, bytes) else model.model_validate(raw)
+        except ValidationError as exc:
+            details = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in exc.errors()
+            )
+            errors.append({"index": index, "error": details})
+            continue
+        chunk.append((index, item))
+        if len(chunk) >= settings.admin_bulk_chunk_size:
+            applied += _apply_chunk(chunk, upsert, errors)
+            chunk = []
+    applied += _apply_chunk(chunk, upsert, errors)
+    return applied, errors
+
+
+@app.post("/admin/rules/bulk")
+async def bulk_upsert_rules(request: Request, x_admin_key: str | None = Header(default=None)) -> dict[str, object]:
+    _require_admin_key(x_admin_key)
+    changed: set[str] = set()
+    applied, errors = await _bulk_upsert(
+        request, AgentRule, lambda repo, rules: changed.update(repo.upsert_rules(rules))
+    )
+    rule_cache.bump(changed)
+    return {"status": "ok", "upserted": len(applied), "errors": errors}
+
+
+@app.post("/admin/bindings/bulk")
+async def bulk_bind_agents(request: Request, x_admin_key: str | None = Header(default=None)) -> dict[str, object]:
+    _require_admin_key(x_admin_key)
+    applied, errors = await _bulk_upsert(
+        request, UserAgentBinding, lambda repo, bindings: repo.bind_user_agents(bindings)
+    )
+    return {"status": "ok", "upserted": len(applied), "errors": errors}
+
+
+@app.post("/admin/rules/snapshot")
+async def export_rule_snapshot(x_admin_key: str | None = Header(default=None)) -> dict[str, int | str]:
+    _require_admin_key(x_admin_key)
+    versions = rule_cache.versions()
+    with runtime.repo_scope() as repo:
+        snapshot = build_snapshot(repo, versions)
+    write_snapshot(snapshot, redis_client=runtime.redis, path=settings.rule_snapshot_file)
+    return {"status": "ok", "agents": len(snapshot["agents"]), "created_at": snapshot["created_at"]}
+
+
+@app.post("/admin/agents")
+async def upsert_agent_settings(
+    agent_settings: AgentSettings, x_admin_key: str | None = Header(default=None)
+) -> dict[str, str]:
+    _require_admin_key(x_admin_key)
+    with runtime.repo_scope() as repo:
+        repo.upsert_agent_settings(agent_settings)
+    rule_cache.bump([agent_settings.agent_id])
+    return {"status": "ok", "agent_id": agent_settings.agent_id}
+
+
 @app.post("/admin/bind/{wa_id}/{agent_id}")
 async def bind_agent(
     wa_id: str,
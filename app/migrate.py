@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from sqlalchemy import Column, Dialect, Engine, inspect, literal, text
+
+from app.db import get_engine, init_db, session_scope
+from app.db_models import Base
+from app.repository import Repository
+
+# create_all only creates missing tables; columns and indexes added to tables that already existed
+# are listed here so `python -m app.migrate` can add them to databases created by older releases.
+ADDED_COLUMNS: dict[str, tuple[str, ...]] = {
+    "schedules": ("template_language", "template_parameters_json"),
+    "outbound_sends": ("template_language", "template_parameters_json", "lease_expires_at"),
+}
+ADDED_INDEXES: dict[str, tuple[str, ...]] = {
+    "inbound_dedup": ("ix_inbound_dedup_created_at",),
+    "outbound_sends": (
+        "ix_outbound_sends_provider_message_id",
+        "ix_outbound_sends_created_at",
+        "ix_outbound_sends_lease_expires_at",
+    ),
+    "conversation_turns": ("ix_conversation_turns_created_at",),
+}
+
+
+def _add_column_sql(table_name: str, column: Column, dialect: Dialect) -> str:
+    quote = dialect.identifier_preparer.quote
+    column_type = column.type.compile(dialect=dialect)
+    ddl = f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column.name)} {column_type}"
+    if column.default is not None and column.default.is_scalar:
+        # Existing rows need a value before NOT NULL can hold.
+        value = literal(column.default.arg, column.type).compile(
+            dialect=dialect, compile_kwargs={"literal_binds": True}
+        )
+        ddl += f" DEFAULT {value}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    return ddl
+
+
+def upgrade_schema(engine: Engine) -> list[str]:
+    """Add missing columns and indexes to existing tables; safe to run on every deploy."""
+    inspector = inspect(engine)
+    applied: list[str] = []
+    with engine.begin() as connection:
+        for table_name, column_names in ADDED_COLUMNS.items():
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            table = Base.metadata.tables[table_name]
+            for name in column_names:
+                if name not in existing:
+                    connection.execute(text(_add_column_sql(table_name, table.c[name], engine.dialect)))
+                    applied.append(f"{table_name}.{name}")
+        for table_name, index_names in ADDED_INDEXES.items():
+            existing = {index["name"] for index in inspector.get_indexes(table_name)}
+            for index in Base.metadata.tables[table_name].indexes:
+                if index.name in index_names and index.name not in existing:
+                    index.create(connection)
+                    applied.append(index.name)
+    return applied
+
+
+def main() -> None:
+    init_db()
+    for name in upgrade_schema(get_engine()):
+        print(f"added {name}")
+    with session_scope() as session:
+        migrated = Repository(session).migrate_legacy_keywords()
+    print(f"migrated keywords for {migrated} rules")
+
+
+if __name__ == "__main__":
+    main()
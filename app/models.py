@@ -1,6 +1,8 @@
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_validator
+
+from app.text import normalize, normalize_keywords
 
 
 class RuleType(str, Enum):
@@ -25,6 +27,28 @@ class AgentRule(BaseModel):
     action: RuleAction = RuleAction.REPLY_TEXT
     reply_text: str = ""
 
+    @field_validator("keywords")
+    @classmethod
+    def _normalize_keywords(cls, value: list[str]) -> list[str]:
+        return normalize_keywords(value)
+
+    @field_validator("prefix")
+    @classmethod
+    def _normalize_prefix(cls, value: str | None) -> str | None:
+        if value is None:
+            return None
+        return normalize(value) or None
+
+
+class AgentSettings(BaseModel):
+    agent_id: str
+    invoke_prefixes: list[str] | None = None
+
+
+class UserAgentBinding(BaseModel):
+    wa_id: str
+    agent_id: str
+
 
 class IncomingMessage(BaseModel):
     message_id: str
@@ -33,6 +57,12 @@ class IncomingMessage(BaseModel):
     is_voice: bool = False
 
 
+class DeliveryStatus(BaseModel):
+    provider_message_id: str
+    status: str
+    error: str | None = None
+
+
 class ConversationTurn(BaseModel):
     wa_id: str
     inbound_text: str
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import cProfile
+import itertools
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[JobTrace | None] = ContextVar("micai_job_trace", default=None)
+_job_counter = itertools.count(1)
+
+
+class JobTrace:
+    def __init__(self, job_type: str):
+        self.job_type = job_type
+        self.phases: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def breakdown(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.phases.items())
+
+
+def current_trace() -> JobTrace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_phase(name: str) -> Iterator[None]:
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - started)
+
+
+class TracedRepository:
+    """Times every repository method call as a `repo.<name>` phase of the current trace."""
+
+    def __init__(self, repo: object):
+        self._repo = repo
+
+    def __getattr__(self, name: str) -> object:
+        attr = getattr(self._repo, name)
+        if not callable(attr):
+            return attr
+
+        def timed(*args: object, **kwargs: object) -> object:
+            with trace_phase(f"repo.{name}"):
+                return attr(*args, **kwargs)
+
+        return timed
+
+
+def _dump_profile(profiler: cProfile.Profile, job_type: str, job_number: int) -> None:
+    directory = Path(settings.job_profile_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{job_type}-{int(time.time())}-{job_number}.prof")
+
+
+@contextmanager
+def trace_job(job_type: str, enqueued_at: float | None = None) -> Iterator[JobTrace | None]:
+    """Record per-phase timings for one job when `job_trace_enabled` is set.
+
+    Jobs slower than `job_slow_threshold_ms` are logged with their breakdown. Every
+    `job_profile_sample_rate`-th job also runs under cProfile and is dumped to `job_profile_dir`.
+    """
+    job_number = next(_job_counter)
+    sample_rate = settings.job_profile_sample_rate
+    profiler = cProfile.Profile() if sample_rate > 0 and job_number % sample_rate == 0 else None
+    if not settings.job_trace_enabled and profiler is None:
+        yield None
+        return
+
+    trace = JobTrace(job_type)
+    if enqueued_at is not None:
+        trace.add("queue_wait", max(0.0, time.time() - enqueued_at))
+    token = _current_trace.set(trace)
+    started = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _dump_profile(profiler, job_type, job_number)
+        _current_trace.reset(token)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if settings.job_trace_enabled and elapsed_ms >= settings.job_slow_threshold_ms:
+            logger.warning("slow job %s took %.1fms: %s", job_type, elapsed_ms, trace.breakdown())
@@ -1,16 +1,42 @@
 from __future__ import annotations
 
+import itertools
 import json
+import time
 from dataclasses import dataclass
 from typing import Protocol
 
 import redis
 
+from app.config import settings
+
+# Dequeue priority order: finishing replies beats taking in new work, housekeeping goes last.
+# RedisJobQueue only follows it on every other poll, so the later lanes cannot starve.
+LANES = ("outbound", "inbound", "spool", "scheduler", "default", "maintenance")
+
 
 @dataclass
 class JobEnvelope:
     job_type: str
     payload: dict
+    enqueued_at: float | None = None
+
+
+def _decode(raw: str) -> JobEnvelope:
+    data = json.loads(raw)
+    return JobEnvelope(job_type=data["job_type"], payload=data["payload"], enqueued_at=data.get("enqueued_at"))
+
+
+def lane_for(job_type: str) -> str:
+    lane = job_type.split(".", 1)[0]
+    return lane if lane in LANES else "default"
+
+
+def _lane_stats(depth: int, oldest: JobEnvelope | None, now: float) -> dict[str, float | int]:
+    age = 0.0
+    if oldest is not None and oldest.enqueued_at is not None:
+        age = max(0.0, now - oldest.enqueued_at)
+    return {"depth": depth, "oldest_age_seconds": round(age, 3)}
 
 
 class JobQueue(Protocol):
@@ -22,18 +48,72 @@ class RedisJobQueue:
     def __init__(self, redis_client: redis.Redis, queue_name: str = "micai:jobs"):
         self.redis = redis_client
         self.queue_name = queue_name
+        # The bare queue name is the pre-lane list; it is drained last so old jobs still run.
+        self.keys = [f"{queue_name}:{lane}" for lane in LANES] + [queue_name]
+        self._polls = itertools.count()
+
+    def _key(self, lane: str) -> str:
+        return f"{self.queue_name}:{lane}"
 
     def enqueue(self, job_type: str, payload: dict) -> None:
-        item = JobEnvelope(job_type=job_type, payload=payload)
-        self.redis.lpush(self.queue_name, json.dumps(item.__dict__))
+        item = JobEnvelope(job_type=job_type, payload=payload, enqueued_at=time.time())
+        self.redis.lpush(self._key(lane_for(job_type)), json.dumps(item.__dict__))
+
+    def _poll_order(self) -> list[str]:
+        """Priority order on even polls; odd polls start from a rotating lane.
+
+        BRPOP always serves the first non-empty key, so a fixed order would let sustained
+        outbound/inbound traffic starve the scheduler and maintenance lanes (and with them
+        maintenance.requeue_sends). Rotating every other poll gives each non-empty lane a turn
+        at least once per 2 * len(keys) polls while the priority lanes keep half of them.
+        """
+        poll = next(self._polls)
+        if poll % 2 == 0:
+            return self.keys
+        start = (poll // 2) % len(self.keys)
+        return self.keys[start:] + self.keys[:start]
+
+    def _pop(self, timeout_seconds: int) -> tuple[str, str] | None:
+        return self.redis.brpop(self._poll_order(), timeout=timeout_seconds)
 
     def dequeue(self, timeout_seconds: int) -> JobEnvelope | None:
-        item = self.redis.brpop(self.queue_name, timeout=timeout_seconds)
+        item = self._pop(timeout_seconds)
         if item is None:
             return None
         _, raw = item
-        data = json.loads(raw)
-        return JobEnvelope(job_type=data["job_type"], payload=data["payload"])
+        return _decode(raw)
+
+    def dequeue_batch(self, timeout_seconds: int, max_items: int) -> list[JobEnvelope]:
+        item = self._pop(timeout_seconds)
+        if item is None:
+            return []
+        key, raw = item
+        rest = self.redis.rpop(key, max_items - 1) if max_items > 1 else None
+        return [_decode(raw), *(_decode(other) for other in rest or [])]
+
+    def stats(self) -> dict[str, dict[str, float | int]]:
+        """Depth and oldest-job age per lane, read in one pipeline round trip.
+
+        Jobs still on the pre-lane list are counted under "default" so intake modes see them.
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.llen(key)
+            pipe.lindex(key, -1)
+        results = pipe.execute()
+        now = time.time()
+        stats = {}
+        for index, lane in enumerate(LANES):
+            depth, oldest = results[2 * index], results[2 * index + 1]
+            stats[lane] = _lane_stats(depth, _decode(oldest) if oldest else None, now)
+        legacy_depth, legacy_oldest = results[-2], results[-1]
+        if legacy_depth:
+            legacy = _lane_stats(legacy_depth, _decode(legacy_oldest) if legacy_oldest else None, now)
+            stats["default"] = {
+                "depth": stats["default"]["depth"] + legacy["depth"],
+                "oldest_age_seconds": max(stats["default"]["oldest_age_seconds"], legacy["oldest_age_seconds"]),
+            }
+        return stats
 
 
 class InMemoryJobQueue:
@@ -41,9 +121,61 @@ class InMemoryJobQueue:
         self.items: list[JobEnvelope] = []
 
     def enqueue(self, job_type: str, payload: dict) -> None:
-        self.items.append(JobEnvelope(job_type=job_type, payload=payload))
+        self.items.append(JobEnvelope(job_type=job_type, payload=payload, enqueued_at=time.time()))
 
     def dequeue(self, timeout_seconds: int = 0) -> JobEnvelope | None:
         if not self.items:
             return None
         return self.items.pop(0)
+
+    def dequeue_batch(self, timeout_seconds: int = 0, max_items: int = 1) -> list[JobEnvelope]:
+        batch, self.items = self.items[:max_items], self.items[max_items:]
+        return batch
+
+    def stats(self) -> dict[str, dict[str, float | int]]:
+        now = time.time()
+        stats = {}
+        for lane in LANES:
+            items = [item for item in self.items if lane_for(item.job_type) == lane]
+            stats[lane] = _lane_stats(len(items), items[0] if items else None, now)
+        return stats
+
+
+class QueueMonitor:
+    """Maps total queue depth to a webhook intake mode: normal, spool or shed.
+
+    Depth is re-read at most every `queue_depth_check_interval_seconds` so the webhook does
+    not add Redis round trips to every request.
+    """
+
+    def __init__(self) -> None:
+        self._checked_at = 0.0
+        self._depth = 0
+
+    def stats(self, queue: JobQueue) -> dict[str, dict[str, float | int]]:
+        stats_fn = getattr(queue, "stats", None)
+        if stats_fn is None:
+            return {}
+        try:
+            return stats_fn()
+        except redis.RedisError:
+            return {}
+
+    def depth(self, queue: JobQueue) -> int:
+        now = time.monotonic()
+        if now - self._checked_at >= settings.queue_depth_check_interval_seconds:
+            self._depth = sum(int(lane["depth"]) for lane in self.stats(queue).values())
+            self._checked_at = now
+        return self._depth
+
+    def mode(self, queue: JobQueue) -> str:
+        spool_at = settings.queue_spool_high_water
+        shed_at = settings.queue_shed_high_water
+        if spool_at <= 0 and shed_at <= 0:
+            return "normal"
+        depth = self.depth(queue)
+        if shed_at > 0 and depth >= shed_at:
+            return "shed"
+        if spool_at > 0 and depth >= spool_at:
+            return "spool"
+        return "normal"
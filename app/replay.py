@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import glob
+import json
+import time
+from collections import Counter
+from collections.abc import Iterable
+
+import httpx
+
+from app.capture import read_captures
+
+
+def parse_speed(value: str) -> float | None:
+    """`1x`/`10x`/`2.5` replay at that multiple of captured time; `max` sends as fast as possible."""
+    if value == "max":
+        return None
+    speed = float(value.removesuffix("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def _count_messages(body: dict) -> int:
+    return sum(
+        len(change.get("value", {}).get("messages", []))
+        for entry in body.get("entry", [])
+        for change in entry.get("changes", [])
+    )
+
+
+async def replay(
+    records: Iterable[dict],
+    url: str,
+    speed: float | None = 1.0,
+    concurrency: int = 16,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> dict[str, float | int]:
+    stats: Counter[str] = Counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(timeout=30, transport=transport) as client:
+
+        async def post(body: dict) -> None:
+            async with semaphore:
+                try:
+                    response = await client.post(url, json=body)
+                except httpx.HTTPError:
+                    stats["transport_errors"] += 1
+                    return
+            stats[f"http_{response.status_code}"] += 1
+            if response.status_code != 200:
+                return
+            result = response.json()
+            stats["messages"] += _count_messages(body)
+            if result.get("status") == "spooled":
+                # Ingested later by a worker, so claim and dedup outcomes are not known here.
+                stats["spooled"] += 1
+                return
+            stats["claimed"] += result.get("processed", 0)
+            stats["uninvoked"] += result.get("uninvoked", 0)
+            stats["statuses"] += result.get("statuses", 0)
+            stats["duplicates"] += result.get("duplicates", 0)
+
+        started = time.perf_counter()
+        first_arrival: float | None = None
+        tasks: list[asyncio.Task[None]] = []
+        for record in records:
+            if speed is not None:
+                first_arrival = record["t"] if first_arrival is None else first_arrival
+                delay = (record["t"] - first_arrival) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            stats["envelopes"] += 1
+            tasks.append(asyncio.create_task(post(record["body"])))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    report: dict[str, float | int] = dict(stats)
+    report["elapsed_seconds"] = round(elapsed, 3)
+    report["envelopes_per_second"] = round(stats["envelopes"] / elapsed, 1) if elapsed else 0
+    report["messages_per_second"] = round(stats["messages"] / elapsed, 1) if elapsed else 0
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay captured webhook traffic against a local instance.")
+    parser.add_argument("captures", nargs="+", help="capture files or globs (webhook-*.jsonl.gz)")
+    parser.add_argument("--url", default="http://localhost:8001/webhook")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1x, 10x, ... or max")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    paths = [path for pattern in args.captures for path in (glob.glob(pattern) or [pattern])]
+    report = asyncio.run(replay(read_captures(paths), args.url, args.speed, args.concurrency))
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
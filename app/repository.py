@@ -1,24 +1,37 @@
 from __future__ import annotations
 
+import json
+from collections.abc import Iterable
 from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import select
+from sqlalchemy import and_, case, delete, event, func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from app.db_models import (
+    AgentRuleKeywordRow,
     AgentRuleRow,
+    AgentSettingsRow,
     ConversationTurnRow,
     InboundDedupRow,
     OutboundSendRow,
+    PendingDeliveryStatusRow,
     ScheduleRow,
     UserAgentBindingRow,
 )
-from app.models import AgentRule, ConversationTurn, RuleAction, RuleType
-
-
-def _keywords_to_csv(keywords: list[str]) -> str:
-    return "|".join(k.strip() for k in keywords if k.strip())
+from app.models import (
+    AgentRule,
+    AgentSettings,
+    ConversationTurn,
+    DeliveryStatus,
+    RuleAction,
+    RuleType,
+    UserAgentBinding,
+)
+from app.rules import split_prefixes
+from app.text import normalize_keywords
+from app.window_cache import FreeformWindowCache
 
 
 def _csv_to_keywords(value: str) -> list[str]:
@@ -27,9 +40,97 @@ def _csv_to_keywords(value: str) -> list[str]:
     return [k for k in value.split("|") if k]
 
 
+def _rule_values(rule: AgentRule) -> dict:
+    return {
+        "id": rule.id,
+        "agent_id": rule.agent_id,
+        "rule_type": rule.rule_type.value,
+        "enabled": rule.enabled,
+        "priority": rule.priority,
+        "prefix": rule.prefix,
+        "action": rule.action.value,
+        "reply_text": rule.reply_text,
+    }
+
+
+def _row_to_rule(row: AgentRuleRow, keywords: list[str]) -> AgentRule:
+    return AgentRule(
+        id=row.id,
+        agent_id=row.agent_id,
+        rule_type=RuleType(row.rule_type),
+        enabled=row.enabled,
+        priority=row.priority,
+        keywords=keywords,
+        prefix=row.prefix,
+        action=RuleAction(row.action),
+        reply_text=row.reply_text,
+    )
+
+
+RETENTION_TABLES = {
+    "inbound_dedup": (InboundDedupRow, InboundDedupRow.message_id),
+    "outbound_sends": (OutboundSendRow, OutboundSendRow.idempotency_key),
+    "conversation_turns": (ConversationTurnRow, ConversationTurnRow.id),
+    "pending_delivery_statuses": (PendingDeliveryStatusRow, PendingDeliveryStatusRow.provider_message_id),
+}
+
+# Delivery statuses only move forward; a late "sent" never overwrites "read".
+_DELIVERY_RANK = {"pending": 0, "sending": 0, "sent": 1, "failed": 2, "delivered": 3, "read": 4}
+
+
+def _outbound_send_values(send: dict, lease_expires_at: datetime) -> dict:
+    return {
+        "idempotency_key": send["idempotency_key"],
+        "wa_id": send["wa_id"],
+        "body": send["body"],
+        "template_name": send.get("template_name"),
+        "template_language": send.get("template_language"),
+        "template_parameters_json": json.dumps(send.get("template_parameters") or []),
+        "status": "sending",
+        "attempts": 1,
+        "lease_expires_at": lease_expires_at,
+    }
+
+
+def _outbound_lease_over(now: datetime):
+    """Unfinished sends nobody holds: rows claimed before leases existed have no expiry."""
+    return and_(
+        OutboundSendRow.status.in_(["sending", "pending"]),
+        or_(OutboundSendRow.lease_expires_at.is_(None), OutboundSendRow.lease_expires_at < now),
+    )
+
+
+def _outbound_reclaimable(now: datetime):
+    return or_(OutboundSendRow.status == "pending", _outbound_lease_over(now))
+
+
+def _insert_for(session: Session):
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
 class Repository:
-    def __init__(self, session: Session):
+    def __init__(self, session: Session, window_cache: FreeformWindowCache | None = None):
         self.session = session
+        self.window_cache = window_cache
+        # Window cache writes wait for the commit, so a rolled-back touch never reports an open window.
+        self._window_touches: list[tuple[list[str], datetime]] = []
+        if window_cache is not None:
+            event.listen(session, "after_commit", self._flush_window_touches)
+            event.listen(session, "after_rollback", self._drop_window_touches)
+
+    def commit(self) -> None:
+        """Commit work so far; the caller's scope keeps using the session afterwards."""
+        self.session.commit()
+
+    def _flush_window_touches(self, session: Session) -> None:
+        touches, self._window_touches = self._window_touches, []
+        for wa_ids, timestamp in touches:
+            self.window_cache.touch(wa_ids, timestamp)
+
+    def _drop_window_touches(self, session: Session) -> None:
+        self._window_touches = []
 
     def claim_inbound_message(self, message_id: str, wa_id: str, text: str) -> bool:
         try:
@@ -41,19 +142,100 @@ class Repository:
             return False
         return True
 
-    def upsert_rule(self, rule: AgentRule) -> None:
+    def upsert_rule(self, rule: AgentRule) -> set[str]:
+        """Returns the agents whose rule sets changed, including one the rule moved away from."""
         row = self.session.get(AgentRuleRow, rule.id)
         if row is None:
             row = AgentRuleRow(id=rule.id)
             self.session.add(row)
+        changed = {rule.agent_id, row.agent_id} - {None}
         row.agent_id = rule.agent_id
         row.rule_type = rule.rule_type.value
         row.enabled = rule.enabled
         row.priority = rule.priority
-        row.keywords_csv = _keywords_to_csv(rule.keywords)
         row.prefix = rule.prefix
         row.action = rule.action.value
         row.reply_text = rule.reply_text
+        self.session.flush()
+        self._replace_keywords({rule.id: rule.keywords})
+        return changed
+
+    def upsert_rules(self, rules: list[AgentRule]) -> set[str]:
+        """Returns the agents whose rule sets changed, including ones rules moved away from."""
+        # Keyed by id so a repeated rule in one chunk does not hit the same row twice.
+        values = {rule.id: _rule_values(rule) for rule in rules}
+        if not values:
+            return set()
+        changed = {rule.agent_id for rule in rules}
+        changed.update(
+            self.session.execute(select(AgentRuleRow.agent_id).where(AgentRuleRow.id.in_(list(values)))).scalars()
+        )
+        stmt = _insert_for(self.session)(AgentRuleRow).values(list(values.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AgentRuleRow.id],
+            set_={column: stmt.excluded[column] for column in next(iter(values.values())) if column != "id"},
+        )
+        self.session.execute(stmt)
+        self._replace_keywords({rule.id: rule.keywords for rule in rules})
+        return changed
+
+    def _replace_keywords(self, keywords_by_rule: dict[str, list[str]]) -> None:
+        if not keywords_by_rule:
+            return
+        self.session.execute(
+            delete(AgentRuleKeywordRow)
+            .where(AgentRuleKeywordRow.rule_id.in_(list(keywords_by_rule)))
+            .execution_options(synchronize_session=False)
+        )
+        rows = [
+            {"rule_id": rule_id, "keyword": keyword}
+            for rule_id, keywords in keywords_by_rule.items()
+            for keyword in keywords
+        ]
+        if rows:
+            self.session.execute(insert(AgentRuleKeywordRow), rows)
+
+    def _load_rules(self, stmt) -> list[AgentRule]:
+        rows = self.session.execute(stmt).scalars().all()
+        keywords: dict[str, list[str]] = {row.id: [] for row in rows}
+        if keywords:
+            keyword_stmt = (
+                select(AgentRuleKeywordRow.rule_id, AgentRuleKeywordRow.keyword)
+                .where(AgentRuleKeywordRow.rule_id.in_(list(keywords)))
+                .order_by(AgentRuleKeywordRow.rule_id, AgentRuleKeywordRow.keyword)
+            )
+            for rule_id, keyword in self.session.execute(keyword_stmt):
+                keywords[rule_id].append(keyword)
+        return [_row_to_rule(row, keywords[row.id]) for row in rows]
+
+    def migrate_legacy_keywords(self) -> int:
+        """Move pipe-joined keywords_csv values into normalized agent_rule_keywords rows."""
+        rows = self.session.execute(select(AgentRuleRow).where(AgentRuleRow.keywords_csv != "")).scalars().all()
+        self._replace_keywords({row.id: normalize_keywords(_csv_to_keywords(row.keywords_csv)) for row in rows})
+        for row in rows:
+            row.keywords_csv = ""
+        return len(rows)
+
+    def upsert_agent_settings(self, agent_settings: AgentSettings) -> None:
+        row = self.session.get(AgentSettingsRow, agent_settings.agent_id)
+        if row is None:
+            row = AgentSettingsRow(agent_id=agent_settings.agent_id)
+            self.session.add(row)
+        prefixes = agent_settings.invoke_prefixes
+        row.invoke_prefixes = ",".join(split_prefixes(",".join(prefixes))) if prefixes else None
+
+    def get_agent_invoke_prefixes(self, agent_id: str) -> tuple[str, ...] | None:
+        row = self.session.get(AgentSettingsRow, agent_id)
+        if row is None or not row.invoke_prefixes:
+            return None
+        return split_prefixes(row.invoke_prefixes)
+
+    def list_agent_invoke_prefixes(self) -> tuple[str, ...]:
+        stmt = select(AgentSettingsRow.invoke_prefixes).where(AgentSettingsRow.invoke_prefixes.is_not(None))
+        prefixes: set[str] = set()
+        for value in self.session.execute(stmt).scalars():
+            prefixes.update(split_prefixes(value))
+        return tuple(sorted(prefixes))
 
     def bind_user_agent(self, wa_id: str, agent_id: str) -> None:
         row = self.session.get(UserAgentBindingRow, wa_id)
@@ -63,8 +245,22 @@ class Repository:
             return
         row.agent_id = agent_id
 
+    def bind_user_agents(self, bindings: list[UserAgentBinding]) -> None:
+        values = {binding.wa_id: binding.agent_id for binding in bindings}
+        if not values:
+            return
+        stmt = _insert_for(self.session)(UserAgentBindingRow).values(
+            [{"wa_id": wa_id, "agent_id": agent_id, "opted_out": False} for wa_id, agent_id in sorted(values.items())]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserAgentBindingRow.wa_id], set_={"agent_id": stmt.excluded.agent_id}
+        )
+        self.session.execute(stmt)
+
     def touch_user_inbound(self, wa_id: str, now: datetime | None = None) -> None:
         timestamp = now or datetime.now(timezone.utc)
+        if self.window_cache is not None:
+            self._window_touches.append(([wa_id], timestamp))
         row = self.session.get(UserAgentBindingRow, wa_id)
         if row is None:
             row = UserAgentBindingRow(wa_id=wa_id, last_inbound_at=timestamp)
@@ -72,27 +268,83 @@ class Repository:
             return
         row.last_inbound_at = timestamp
 
-    def get_rules_for_user(self, wa_id: str) -> list[AgentRule]:
+    def touch_users_inbound(self, wa_ids: Iterable[str], now: datetime | None = None) -> int:
+        unique = sorted(set(wa_ids))
+        if not unique:
+            return 0
+        timestamp = now or datetime.now(timezone.utc)
+        stmt = _insert_for(self.session)(UserAgentBindingRow).values(
+            [
+                {"wa_id": wa_id, "agent_id": "default-agent", "opted_out": False, "last_inbound_at": timestamp}
+                for wa_id in unique
+            ]
+        )
+        current = UserAgentBindingRow.last_inbound_at
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserAgentBindingRow.wa_id],
+            set_={
+                "last_inbound_at": case(
+                    (current.is_(None) | (current < stmt.excluded.last_inbound_at), stmt.excluded.last_inbound_at),
+                    else_=current,
+                )
+            },
+        )
+        self.session.execute(stmt)
+        if self.window_cache is not None:
+            self._window_touches.append((unique, timestamp))
+        return len(unique)
+
+    def get_agent_id_for_user(self, wa_id: str) -> str:
         binding = self.session.get(UserAgentBindingRow, wa_id)
-        agent_id = binding.agent_id if binding else "default-agent"
+        return binding.agent_id if binding and binding.agent_id else "default-agent"
+
+    def get_rules_for_user(self, wa_id: str) -> list[AgentRule]:
+        return self.get_rules_for_agent(self.get_agent_id_for_user(wa_id))
+
+    def get_rules_for_agent(self, agent_id: str) -> list[AgentRule]:
         stmt = (
             select(AgentRuleRow)
             .where(AgentRuleRow.agent_id == agent_id)
             .where(AgentRuleRow.enabled.is_(True))
             .order_by(AgentRuleRow.priority.asc())
         )
-        rows = self.session.execute(stmt).scalars().all()
+        return self._load_rules(stmt)
+
+    def get_candidate_rules(self, agent_id: str, normalized_text: str) -> list[AgentRule]:
+        """Prefix rules plus keyword rules with a keyword occurring anywhere in the message.
+
+        This is the same substring test match_rule applies, so the result is always a superset of
+        what the in-memory path would match, however many rules the agent has.
+        """
+        keyword_rule_ids = (
+            select(AgentRuleKeywordRow.rule_id)
+            .join(AgentRuleRow, AgentRuleRow.id == AgentRuleKeywordRow.rule_id)
+            .where(AgentRuleRow.agent_id == agent_id)
+            .where(literal(normalized_text).contains(AgentRuleKeywordRow.keyword))
+        )
+        stmt = (
+            select(AgentRuleRow)
+            .where(AgentRuleRow.agent_id == agent_id)
+            .where(AgentRuleRow.enabled.is_(True))
+            .where((AgentRuleRow.rule_type == RuleType.PREFIX.value) | AgentRuleRow.id.in_(keyword_rule_ids))
+            .order_by(AgentRuleRow.priority.asc())
+        )
+        return self._load_rules(stmt)
+
+    def list_enabled_rules(self) -> list[AgentRule]:
+        stmt = (
+            select(AgentRuleRow)
+            .where(AgentRuleRow.enabled.is_(True))
+            .order_by(AgentRuleRow.agent_id.asc(), AgentRuleRow.priority.asc())
+        )
+        return self._load_rules(stmt)
+
+    def list_agent_settings(self) -> list[AgentSettings]:
+        rows = self.session.execute(select(AgentSettingsRow)).scalars().all()
         return [
-            AgentRule(
-                id=row.id,
+            AgentSettings(
                 agent_id=row.agent_id,
-                rule_type=RuleType(row.rule_type),
-                enabled=row.enabled,
-                priority=row.priority,
-                keywords=_csv_to_keywords(row.keywords_csv),
-                prefix=row.prefix,
-                action=RuleAction(row.action),
-                reply_text=row.reply_text,
+                invoke_prefixes=list(split_prefixes(row.invoke_prefixes)) if row.invoke_prefixes else None,
             )
             for row in rows
         ]
@@ -112,6 +364,8 @@ class Repository:
         return row.last_inbound_at if row else None
 
     def can_send_freeform(self, wa_id: str, window_hours: int, now: datetime | None = None) -> bool:
+        if now is None and self.window_cache is not None and self.window_cache.is_open(wa_id):
+            return True
         last_inbound = self.get_last_inbound_at(wa_id)
         if last_inbound is None:
             return False
@@ -121,23 +375,30 @@ class Repository:
         return (current - last_inbound) <= timedelta(hours=window_hours)
 
     def try_start_outbound_send(
-        self, idempotency_key: str, wa_id: str, body: str, template_name: str | None
+        self,
+        idempotency_key: str,
+        wa_id: str,
+        body: str,
+        template_name: str | None,
+        *,
+        lease_seconds: int,
+        max_attempts: int,
+        template_language: str | None = None,
+        template_parameters: list[str] | None = None,
+        now: datetime | None = None,
     ) -> bool:
-        try:
-            with self.session.begin_nested():
-                row = OutboundSendRow(
-                    idempotency_key=idempotency_key,
-                    wa_id=wa_id,
-                    body=body,
-                    template_name=template_name,
-                    status="sending",
-                    attempts=1,
-                )
-                self.session.add(row)
-                self.session.flush()
-        except IntegrityError:
-            return False
-        return True
+        send = {
+            "idempotency_key": idempotency_key,
+            "wa_id": wa_id,
+            "body": body,
+            "template_name": template_name,
+            "template_language": template_language,
+            "template_parameters": template_parameters,
+        }
+        claimed = self.try_start_outbound_sends(
+            [send], lease_seconds=lease_seconds, max_attempts=max_attempts, now=now
+        )
+        return idempotency_key in claimed
 
     def mark_outbound_sent(self, idempotency_key: str, provider_message_id: str | None = None) -> None:
         row = self.session.get(OutboundSendRow, idempotency_key)
@@ -146,6 +407,9 @@ class Repository:
         row.status = "sent"
         row.provider_message_id = provider_message_id
         row.last_error = None
+        if provider_message_id:
+            self.session.flush()
+            self.release_pending_delivery_statuses([provider_message_id])
 
     def mark_outbound_failed(self, idempotency_key: str, error: str) -> None:
         row = self.session.get(OutboundSendRow, idempotency_key)
@@ -154,6 +418,180 @@ class Repository:
         row.status = "failed"
         row.last_error = error
 
+    def try_start_outbound_sends(
+        self, sends: list[dict], *, lease_seconds: int, max_attempts: int, now: datetime | None = None
+    ) -> set[str]:
+        """Claim many idempotency keys in one upsert; returns the keys this caller now owns.
+
+        New keys are inserted with a lease. Existing keys are taken over only when they were
+        re-queued by the sweeper or their lease ran out, and each takeover counts an attempt.
+        """
+        current = now or datetime.now(timezone.utc)
+        lease_expires_at = current + timedelta(seconds=lease_seconds)
+        rows = {send["idempotency_key"]: _outbound_send_values(send, lease_expires_at) for send in sends}
+        if not rows:
+            return set()
+        stmt = _insert_for(self.session)(OutboundSendRow).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[OutboundSendRow.idempotency_key],
+            set_={
+                "status": "sending",
+                "attempts": OutboundSendRow.attempts + 1,
+                "lease_expires_at": stmt.excluded.lease_expires_at,
+                "updated_at": func.now(),
+            },
+            where=and_(_outbound_reclaimable(current), OutboundSendRow.attempts < max_attempts),
+        ).returning(OutboundSendRow.idempotency_key)
+        return set(self.session.execute(stmt).scalars().all())
+
+    def requeue_expired_outbound_sends(
+        self, *, lease_seconds: int, max_attempts: int, limit: int, now: datetime | None = None
+    ) -> list[OutboundSendRow]:
+        """Flip up to `limit` abandoned sends back to "pending" and return them for re-enqueueing.
+
+        The fresh lease keeps the next sweep from queuing the same row again while its job waits.
+        """
+        current = now or datetime.now(timezone.utc)
+        stmt = (
+            select(OutboundSendRow)
+            .where(_outbound_lease_over(current))
+            .where(OutboundSendRow.attempts < max_attempts)
+            .order_by(OutboundSendRow.lease_expires_at.asc())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        rows = self.session.execute(stmt).scalars().all()
+        if rows:
+            self.session.execute(
+                update(OutboundSendRow)
+                .where(OutboundSendRow.idempotency_key.in_([row.idempotency_key for row in rows]))
+                .values(status="pending", lease_expires_at=current + timedelta(seconds=lease_seconds))
+                .execution_options(synchronize_session="fetch")
+            )
+        return rows
+
+    def fail_exhausted_outbound_sends(self, *, max_attempts: int, now: datetime | None = None) -> int:
+        current = now or datetime.now(timezone.utc)
+        stmt = (
+            update(OutboundSendRow)
+            .where(_outbound_lease_over(current))
+            .where(OutboundSendRow.attempts >= max_attempts)
+            .values(status="failed", last_error="lease expired after max attempts", lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        )
+        return self.session.execute(stmt).rowcount
+
+    def mark_outbound_results(self, sent: dict[str, str | None], failed: dict[str, str]) -> None:
+        updates = [
+            {"idempotency_key": key, "status": "sent", "provider_message_id": provider_id, "last_error": None}
+            for key, provider_id in sent.items()
+        ] + [{"idempotency_key": key, "status": "failed", "last_error": error} for key, error in failed.items()]
+        if updates:
+            self.session.execute(update(OutboundSendRow), updates)
+        self.release_pending_delivery_statuses([provider_id for provider_id in sent.values() if provider_id])
+
+    def apply_delivery_statuses(self, statuses: list[DeliveryStatus]) -> int:
+        latest: dict[str, DeliveryStatus] = {}
+        for status in statuses:
+            if status.status not in _DELIVERY_RANK:
+                continue
+            current = latest.get(status.provider_message_id)
+            if current is None or _DELIVERY_RANK[status.status] > _DELIVERY_RANK[current.status]:
+                latest[status.provider_message_id] = status
+        if not latest:
+            return 0
+
+        by_status: dict[str, list[DeliveryStatus]] = {}
+        for status in latest.values():
+            by_status.setdefault(status.status, []).append(status)
+
+        updated = 0
+        for value, items in by_status.items():
+            earlier = [name for name, rank in _DELIVERY_RANK.items() if rank < _DELIVERY_RANK[value]]
+            changes: dict = {"status": value}
+            if value == "failed":
+                changes["last_error"] = case(
+                    {item.provider_message_id: item.error for item in items},
+                    value=OutboundSendRow.provider_message_id,
+                    else_=OutboundSendRow.last_error,
+                )
+            stmt = (
+                update(OutboundSendRow)
+                .where(OutboundSendRow.provider_message_id.in_([item.provider_message_id for item in items]))
+                .where(OutboundSendRow.status.in_(earlier))
+                .values(**changes)
+                .execution_options(synchronize_session=False)
+            )
+            updated += self.session.execute(stmt).rowcount
+
+        known = set(
+            self.session.execute(
+                select(OutboundSendRow.provider_message_id).where(
+                    OutboundSendRow.provider_message_id.in_(list(latest))
+                )
+            ).scalars()
+        )
+        self._hold_delivery_statuses([status for key, status in latest.items() if key not in known])
+        return updated
+
+    def _hold_delivery_statuses(self, statuses: list[DeliveryStatus]) -> None:
+        """Park statuses for sends the worker has not recorded yet; only a higher rank replaces one."""
+        if not statuses:
+            return
+        stmt = _insert_for(self.session)(PendingDeliveryStatusRow).values(
+            [
+                {"provider_message_id": item.provider_message_id, "status": item.status, "error": item.error}
+                for item in statuses
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PendingDeliveryStatusRow.provider_message_id],
+            set_={"status": stmt.excluded.status, "error": stmt.excluded.error},
+            where=case(_DELIVERY_RANK, value=PendingDeliveryStatusRow.status, else_=-1)
+            < case(_DELIVERY_RANK, value=stmt.excluded.status, else_=-1),
+        )
+        self.session.execute(stmt)
+
+    def release_pending_delivery_statuses(self, provider_message_ids: list[str] | None = None) -> int:
+        """Apply held statuses whose send is now in the ledger; None checks every held status."""
+        if provider_message_ids is not None and not provider_message_ids:
+            return 0
+        stmt = select(PendingDeliveryStatusRow).join(
+            OutboundSendRow, OutboundSendRow.provider_message_id == PendingDeliveryStatusRow.provider_message_id
+        )
+        if provider_message_ids is not None:
+            stmt = stmt.where(PendingDeliveryStatusRow.provider_message_id.in_(provider_message_ids))
+        held = self.session.execute(stmt).scalars().all()
+        if not held:
+            return 0
+        statuses = [
+            DeliveryStatus(provider_message_id=row.provider_message_id, status=row.status, error=row.error)
+            for row in held
+        ]
+        self.session.execute(
+            delete(PendingDeliveryStatusRow)
+            .where(PendingDeliveryStatusRow.provider_message_id.in_([row.provider_message_id for row in held]))
+            .execution_options(synchronize_session=False)
+        )
+        return self.apply_delivery_statuses(statuses)
+
+    def list_expired_rows(
+        self, table: str, cutoff: datetime, limit: int, after: tuple[datetime, object] | None = None
+    ) -> list:
+        model, key = RETENTION_TABLES[table]
+        stmt = select(model).where(model.created_at < cutoff)
+        if after is not None:
+            stmt = stmt.where(tuple_(model.created_at, key) > tuple_(*after))
+        stmt = stmt.order_by(model.created_at.asc(), key.asc()).limit(limit)
+        return self.session.execute(stmt).scalars().all()
+
+    def delete_rows(self, table: str, keys: list) -> int:
+        model, key = RETENTION_TABLES[table]
+        if not keys:
+            return 0
+        stmt = delete(model).where(key.in_(keys)).execution_options(synchronize_session=False)
+        return self.session.execute(stmt).rowcount
+
     def list_due_schedules(self, now: datetime | None = None) -> list[ScheduleRow]:
         current = now or datetime.now(timezone.utc)
         stmt = (
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from app.config import settings
+from app.repository import RETENTION_TABLES, Repository
+
+logger = logging.getLogger(__name__)
+
+
+def _retention_days() -> dict[str, int]:
+    return {
+        "inbound_dedup": settings.retention_inbound_dedup_days,
+        "outbound_sends": settings.retention_outbound_sends_days,
+        "conversation_turns": settings.retention_conversation_turns_days,
+        "pending_delivery_statuses": settings.retention_pending_delivery_statuses_days,
+    }
+
+
+def _row_to_dict(row: object) -> dict:
+    return {column.key: getattr(row, column.key) for column in row.__table__.columns}
+
+
+def prune_table(
+    repo_scope: Callable[[], AbstractContextManager[Repository]],
+    table: str,
+    cutoff: datetime,
+    batch_size: int,
+    export_path: Path | None = None,
+) -> int:
+    """Delete rows older than `cutoff` one batch per transaction so no lock is held for long.
+
+    When `export_path` is set, each batch is appended to a gzipped JSONL file before it is deleted.
+    """
+    _, key = RETENTION_TABLES[table]
+    after: tuple[datetime, object] | None = None
+    pruned = 0
+    while True:
+        with repo_scope() as repo:
+            rows = repo.list_expired_rows(table, cutoff, batch_size, after=after)
+            if not rows:
+                break
+            if export_path is not None:
+                with gzip.open(export_path, "at", encoding="utf-8") as handle:
+                    for row in rows:
+                        handle.write(json.dumps(_row_to_dict(row), default=str) + "\n")
+            keys = [getattr(row, key.key) for row in rows]
+            after = (rows[-1].created_at, keys[-1])
+            pruned += repo.delete_rows(table, keys)
+        if len(rows) < batch_size:
+            break
+    return pruned
+
+
+def prune_expired_rows(
+    repo_scope: Callable[[], AbstractContextManager[Repository]], now: datetime | None = None
+) -> dict[str, int]:
+    current = now or datetime.now(timezone.utc)
+    export_dir = Path(settings.retention_export_dir) if settings.retention_export_dir else None
+    if export_dir is not None:
+        export_dir.mkdir(parents=True, exist_ok=True)
+
+    report: dict[str, int] = {}
+    for table, days in _retention_days().items():
+        if days <= 0:
+            continue
+        export_path = None
+        if export_dir is not None:
+            export_path = export_dir / f"{table}-{current.strftime('%Y%m%dT%H%M%SZ')}.jsonl.gz"
+        report[table] = prune_table(
+            repo_scope,
+            table,
+            current - timedelta(days=days),
+            settings.retention_batch_size,
+            export_path=export_path,
+        )
+    logger.info("retention pruned rows: %s", report)
+    return report
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+import redis
+
+from app.config import settings
+from app.models import AgentRule
+from app.repository import Repository
+from app.rules import InvokeGate, compile_invoke_gate, split_prefixes
+
+RULE_VERSIONS_KEY = "micai:rules:versions"
+# An entry kept alive by unchanged versions is still reloaded after this many TTLs, so a missed
+# bump (Redis down during an admin write) cannot leave a worker stale for longer than that.
+MAX_AGE_TTLS = 5
+
+
+@dataclass(frozen=True)
+class AgentRuleSet:
+    agent_id: str
+    rules: list[AgentRule]
+    gate: InvokeGate
+    version: int = 0
+    # Set for agents above `rule_candidate_filter_min_rules`: rules are not held in memory and
+    # each message fetches its candidates with Repository.get_candidate_rules instead.
+    candidate_filter: bool = False
+
+
+def default_invoke_gate() -> InvokeGate:
+    return compile_invoke_gate(split_prefixes(settings.invoke_prefixes))
+
+
+def build_rule_set(
+    agent_id: str, rules: list[AgentRule], invoke_prefixes: Iterable[str] | None, version: int = 0
+) -> AgentRuleSet:
+    prefixes = split_prefixes(",".join(invoke_prefixes)) if invoke_prefixes else ()
+    gate = compile_invoke_gate(prefixes) if prefixes else default_invoke_gate()
+    threshold = settings.rule_candidate_filter_min_rules
+    if threshold > 0 and len(rules) >= threshold:
+        return AgentRuleSet(agent_id=agent_id, rules=[], gate=gate, version=version, candidate_filter=True)
+    return AgentRuleSet(agent_id=agent_id, rules=rules, gate=gate, version=version)
+
+
+class RuleSetCache:
+    """Per-process cache of enabled rules and invoke gates, refreshed after a TTL.
+
+    With Redis attached, every admin write bumps a per-agent version. An expired entry whose
+    version is unchanged is kept, so only agents that actually changed are reloaded from the DB,
+    up to MAX_AGE_TTLS after it was loaded.
+    """
+
+    def __init__(self) -> None:
+        self.redis: redis.Redis | None = None
+        # agent_id -> (checked_at, loaded_at, rule set)
+        self._rule_sets: dict[str, tuple[float, float, AgentRuleSet]] = {}
+        self._any_gate: tuple[float, InvokeGate] | None = None
+
+    def _fresh(self, checked_at: float) -> bool:
+        return time.monotonic() - checked_at < settings.rule_cache_ttl_seconds
+
+    def _within_max_age(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < settings.rule_cache_ttl_seconds * MAX_AGE_TTLS
+
+    def _version(self, agent_id: str) -> int | None:
+        if self.redis is None:
+            return None
+        try:
+            return int(self.redis.hget(RULE_VERSIONS_KEY, agent_id) or 0)
+        except redis.RedisError:
+            return None
+
+    def _read_versions(self) -> dict[str, int]:
+        return {agent_id: int(value) for agent_id, value in self.redis.hgetall(RULE_VERSIONS_KEY).items()}
+
+    def versions(self) -> dict[str, int]:
+        if self.redis is None:
+            return {}
+        try:
+            return self._read_versions()
+        except redis.RedisError:
+            return {}
+
+    def get(self, repo: Repository, agent_id: str) -> AgentRuleSet:
+        cached = self._rule_sets.get(agent_id)
+        if cached is not None and self._fresh(cached[0]):
+            return cached[2]
+
+        version = self._version(agent_id)
+        if (
+            cached is not None
+            and version is not None
+            and version == cached[2].version
+            and self._within_max_age(cached[1])
+        ):
+            self._rule_sets[agent_id] = (time.monotonic(), cached[1], cached[2])
+            return cached[2]
+
+        rule_set = build_rule_set(
+            agent_id,
+            repo.get_rules_for_agent(agent_id),
+            repo.get_agent_invoke_prefixes(agent_id),
+            version=version or 0,
+        )
+        now = time.monotonic()
+        self._rule_sets[agent_id] = (now, now, rule_set)
+        return rule_set
+
+    def any_gate(self, repo: Repository) -> InvokeGate:
+        """Gate over every prefix any agent accepts; a miss means no agent is invoked."""
+        if self._any_gate is not None and self._fresh(self._any_gate[0]):
+            return self._any_gate[1]
+
+        prefixes = split_prefixes(settings.invoke_prefixes) + repo.list_agent_invoke_prefixes()
+        gate = compile_invoke_gate(tuple(sorted(set(prefixes))))
+        self._any_gate = (time.monotonic(), gate)
+        return gate
+
+    def load(self, rule_sets: Iterable[AgentRuleSet]) -> int:
+        """Seed the cache from snapshot rule sets, skipping agents changed since the snapshot."""
+        current: dict[str, int] | None = None
+        if self.redis is not None:
+            try:
+                current = self._read_versions()
+            except redis.RedisError:
+                # Without versions a stale snapshot cannot be told apart; let the DB fill the cache.
+                return 0
+        loaded_at = time.monotonic()
+        prefixes = set(split_prefixes(settings.invoke_prefixes))
+        count = 0
+        skipped = False
+        for rule_set in rule_sets:
+            if current is not None and current.get(rule_set.agent_id, 0) != rule_set.version:
+                skipped = True
+                continue
+            self._rule_sets[rule_set.agent_id] = (loaded_at, loaded_at, rule_set)
+            prefixes.update(rule_set.gate.prefixes)
+            count += 1
+        if not skipped:
+            # A skipped agent's prefixes would be missing, so then any_gate is rebuilt from the DB.
+            self._any_gate = (loaded_at, compile_invoke_gate(tuple(sorted(prefixes))))
+        return count
+
+    def bump(self, agent_ids: Iterable[str]) -> None:
+        unique = sorted(set(agent_ids))
+        for agent_id in unique:
+            self.invalidate(agent_id)
+        if self.redis is None or not unique:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for agent_id in unique:
+                pipe.hincrby(RULE_VERSIONS_KEY, agent_id, 1)
+            pipe.execute()
+        except redis.RedisError:
+            return
+
+    def invalidate(self, agent_id: str | None = None) -> None:
+        self._any_gate = None
+        if agent_id is None:
+            self._rule_sets.clear()
+        else:
+            self._rule_sets.pop(agent_id, None)
+
+
+rule_cache = RuleSetCache()
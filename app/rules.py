@@ -1,18 +1,39 @@
+import re
+from functools import lru_cache
+
 from app.models import AgentRule, RuleType
+from app.text import normalize
+
+
+def split_prefixes(value: str) -> tuple[str, ...]:
+    return tuple(p for p in (normalize(part) for part in value.split(",")) if p)
+
 
+class InvokeGate:
+    def __init__(self, prefixes: tuple[str, ...]):
+        self.prefixes = tuple(dict.fromkeys(prefixes))
+        self._pattern = (
+            re.compile("|".join(re.escape(p) for p in self.prefixes)) if self.prefixes else None
+        )
 
-def normalize(text: str) -> str:
-    return " ".join(text.strip().lower().split())
+    def matches(self, normalized_text: str) -> bool:
+        return self._pattern is not None and self._pattern.match(normalized_text) is not None
 
 
-def match_rule(text: str, rules: list[AgentRule]) -> AgentRule | None:
-    candidate = normalize(text)
+@lru_cache(maxsize=256)
+def compile_invoke_gate(prefixes: tuple[str, ...]) -> InvokeGate:
+    return InvokeGate(prefixes)
+
+
+def match_rule(text: str, rules: list[AgentRule], normalized: str | None = None) -> AgentRule | None:
+    # Rule prefixes and keywords are normalized when the AgentRule is built.
+    candidate = normalized if normalized is not None else normalize(text)
     for rule in rules:
         if rule.rule_type == RuleType.PREFIX and rule.prefix:
-            if candidate.startswith(normalize(rule.prefix)):
+            if candidate.startswith(rule.prefix):
                 return rule
         if rule.rule_type == RuleType.KEYWORD and rule.keywords:
-            lowered = [normalize(k) for k in rule.keywords]
-            if any(keyword in candidate for keyword in lowered):
+            if any(keyword in candidate for keyword in rule.keywords):
                 return rule
     return None
+
@@ -1,41 +1,57 @@
 from __future__ import annotations
 
 from contextlib import contextmanager
-from typing import Iterator
+from typing import TYPE_CHECKING, Iterator
 
 import redis
 
 from app.config import settings
-from app.db import init_db
-from app.db import session_scope as db_session_scope
-from app.queue import InMemoryJobQueue, JobQueue, RedisJobQueue
-from app.repository import Repository
+from app.profiling import TracedRepository, current_trace
+from app.queue import InMemoryJobQueue, JobQueue, QueueMonitor, RedisJobQueue
+from app.window_cache import FreeformWindowCache, RedisFreeformWindowCache
+
+if TYPE_CHECKING:
+    from app.repository import Repository
 
 
 class Runtime:
     def __init__(self) -> None:
         self.queue: JobQueue = InMemoryJobQueue()
+        self.redis: redis.Redis | None = None
         self.redis_queue: RedisJobQueue | None = None
+        self.window_cache: FreeformWindowCache | None = None
+        self.queue_monitor = QueueMonitor()
 
     def initialize(self) -> None:
-        init_db()
         if settings.app_env != "test":
             try:
                 client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
                 client.ping()
+                self.redis = client
                 self.redis_queue = RedisJobQueue(client)
                 self.queue = self.redis_queue
+                self.window_cache = RedisFreeformWindowCache(client, settings.freeform_window_hours)
             except Exception:
+                self.redis = None
                 self.redis_queue = None
+                self.window_cache = None
 
     @contextmanager
     def repo_scope(self) -> Iterator[Repository]:
+        # Deferred so processes that only enqueue (the scheduler) never load SQLAlchemy.
+        from app.db import session_scope as db_session_scope
+        from app.repository import Repository
+
         with db_session_scope() as session:
-            yield Repository(session)
+            repo = Repository(session, window_cache=self.window_cache)
+            yield TracedRepository(repo) if current_trace() is not None else repo
 
     def set_test_queue(self, queue: JobQueue) -> None:
         self.queue = queue
+        self.queue_monitor = QueueMonitor()
+        self.redis = None
         self.redis_queue = None
+        self.window_cache = None
 
 
 runtime = Runtime()
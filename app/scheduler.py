@@ -2,13 +2,22 @@ from __future__ import annotations
 
 import time
 
+from app.config import settings
 from app.runtime import runtime
 
 
 def run_scheduler_loop(interval_seconds: int = 15) -> None:
     runtime.initialize()
+    next_prune_at = time.monotonic()
+    next_sweep_at = time.monotonic()
     while True:
         runtime.queue.enqueue("scheduler.dispatch_due", {})
+        if settings.retention_interval_seconds > 0 and time.monotonic() >= next_prune_at:
+            runtime.queue.enqueue("maintenance.prune", {})
+            next_prune_at = time.monotonic() + settings.retention_interval_seconds
+        if settings.outbound_sweep_interval_seconds > 0 and time.monotonic() >= next_sweep_at:
+            runtime.queue.enqueue("maintenance.requeue_sends", {})
+            next_sweep_at = time.monotonic() + settings.outbound_sweep_interval_seconds
         time.sleep(interval_seconds)
 
 
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+
+import redis
+
+from app.config import settings
+from app.models import AgentRule
+from app.repository import Repository
+from app.rule_cache import AgentRuleSet, build_rule_set, rule_cache
+from app.runtime import runtime
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_KEY = "micai:rules:snapshot"
+
+
+def build_snapshot(repo: Repository, versions: dict[str, int] | None = None) -> dict:
+    """Collect every enabled rule and agent setting into one JSON-serializable document."""
+    agents: dict[str, dict] = {}
+    for agent_settings in repo.list_agent_settings():
+        agents[agent_settings.agent_id] = {"invoke_prefixes": agent_settings.invoke_prefixes, "rules": []}
+    for rule in repo.list_enabled_rules():
+        entry = agents.setdefault(rule.agent_id, {"invoke_prefixes": None, "rules": []})
+        entry["rules"].append(rule.model_dump(mode="json", exclude={"agent_id"}))
+
+    versions = versions or {}
+    for agent_id, entry in agents.items():
+        entry["version"] = versions.get(agent_id, 0)
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "agents": agents,
+    }
+
+
+def snapshot_rule_sets(snapshot: dict) -> list[AgentRuleSet]:
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported rule snapshot format: {snapshot.get('format')!r}")
+    return [
+        build_rule_set(
+            agent_id,
+            [AgentRule(agent_id=agent_id, **rule) for rule in entry["rules"]],
+            entry.get("invoke_prefixes"),
+            version=entry.get("version", 0),
+        )
+        for agent_id, entry in snapshot["agents"].items()
+    ]
+
+
+def write_snapshot(snapshot: dict, redis_client: redis.Redis | None = None, path: str | None = None) -> None:
+    data = json.dumps(snapshot, separators=(",", ":"))
+    if path:
+        Path(path).write_text(data, encoding="utf-8")
+    if redis_client is not None:
+        redis_client.set(SNAPSHOT_KEY, data)
+
+
+def read_snapshot(redis_client: redis.Redis | None = None, path: str | None = None) -> dict | None:
+    if path:
+        file = Path(path)
+        return json.loads(file.read_text(encoding="utf-8")) if file.exists() else None
+    if redis_client is None:
+        return None
+    data = redis_client.get(SNAPSHOT_KEY)
+    return json.loads(data) if data else None
+
+
+def load_snapshot_into_cache() -> int:
+    """Seed the rule cache from the latest snapshot; returns the number of agents loaded."""
+    try:
+        snapshot = read_snapshot(runtime.redis, settings.rule_snapshot_file)
+        if snapshot is None:
+            return 0
+        rule_sets = snapshot_rule_sets(snapshot)
+    except (redis.RedisError, OSError, ValueError, KeyError, TypeError, AttributeError) as exc:
+        logger.warning("ignoring unusable rule snapshot: %s", exc)
+        return 0
+    return rule_cache.load(rule_sets)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export enabled agent rules for worker warm start.")
+    parser.add_argument("--file", default=settings.rule_snapshot_file, help="write to this file instead of Redis")
+    args = parser.parse_args()
+
+    runtime.initialize()
+    rule_cache.redis = runtime.redis
+    with runtime.repo_scope() as repo:
+        snapshot = build_snapshot(repo, rule_cache.versions())
+    write_snapshot(snapshot, redis_client=None if args.file else runtime.redis, path=args.file)
+    print(json.dumps({"agents": len(snapshot["agents"]), "created_at": snapshot["created_at"]}))
+
+
+if __name__ == "__main__":
+    main()
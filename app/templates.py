@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+from app.config import settings
+
+
+class TemplateError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class TemplateSpec:
+    name: str
+    languages: tuple[str, ...]
+    parameter_count: int = 0
+
+
+class TemplateRegistry:
+    """Approved WhatsApp templates, checked locally before any send.
+
+    A registry built without templates (no file configured) accepts every template so local
+    development keeps working before templates are approved.
+    """
+
+    def __init__(self, templates: dict[str, TemplateSpec] | None = None):
+        self.templates = templates
+
+    @classmethod
+    def from_file(cls, path: str) -> TemplateRegistry:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        templates = {
+            item["name"]: TemplateSpec(
+                name=item["name"],
+                languages=tuple(item.get("languages") or [settings.template_default_language]),
+                parameter_count=int(item.get("parameters", 0)),
+            )
+            for item in data.get("templates", [])
+        }
+        return cls(templates)
+
+    def resolve(self, name: str, language: str | None, parameters: list[str]) -> str:
+        """Validate a template send and return the language code to use."""
+        if self.templates is None:
+            return language or settings.template_default_language
+
+        spec = self.templates.get(name)
+        if spec is None:
+            raise TemplateError(f"Unknown template {name!r}")
+        if len(parameters) != spec.parameter_count:
+            raise TemplateError(
+                f"Template {name!r} expects {spec.parameter_count} parameters, got {len(parameters)}"
+            )
+        if language is not None:
+            if language not in spec.languages:
+                raise TemplateError(f"Template {name!r} is not approved for language {language!r}")
+            return language
+        if settings.template_default_language in spec.languages:
+            return settings.template_default_language
+        return spec.languages[0]
+
+
+@lru_cache(maxsize=1)
+def template_registry() -> TemplateRegistry:
+    if not settings.template_registry_file:
+        return TemplateRegistry()
+    return TemplateRegistry.from_file(settings.template_registry_file)
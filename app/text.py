@@ -0,0 +1,9 @@
+from collections.abc import Iterable
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.strip().lower().split())
+
+
+def normalize_keywords(keywords: Iterable[str]) -> list[str]:
+    return list(dict.fromkeys(k for k in (normalize(keyword) for keyword in keywords) if k))
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-import httpx
+import asyncio
+import uuid
 
 from app.config import settings
 
@@ -9,9 +10,19 @@ class WhatsAppClient:
     def __init__(self) -> None:
         self.base_url = "https://graph.facebook.com/v22.0"
 
+    async def _stub_send(self) -> str:
+        # Offline stand-in for the Cloud API so load tests exercise the full send path.
+        if settings.whatsapp_stub_latency_ms:
+            await asyncio.sleep(settings.whatsapp_stub_latency_ms / 1000)
+        return f"wamid.stub.{uuid.uuid4().hex}"
+
     async def send_text(self, wa_id: str, text: str) -> str | None:
+        if settings.whatsapp_stub:
+            return await self._stub_send()
         if not settings.outbound_reply_enabled:
             return None
+        import httpx
+
         url = f"{self.base_url}/{settings.whatsapp_phone_number_id}/messages"
         payload = {
             "messaging_product": "whatsapp",
@@ -27,9 +38,19 @@ class WhatsAppClient:
             messages = data.get("messages", [])
             return messages[0].get("id") if messages else None
 
-    async def send_template(self, wa_id: str, template_name: str) -> str | None:
+    async def send_template(
+        self,
+        wa_id: str,
+        template_name: str,
+        language: str | None = None,
+        parameters: list[str] | None = None,
+    ) -> str | None:
+        if settings.whatsapp_stub:
+            return await self._stub_send()
         if not settings.outbound_reply_enabled:
             return None
+        import httpx
+
         url = f"{self.base_url}/{settings.whatsapp_phone_number_id}/messages"
         payload = {
             "messaging_product": "whatsapp",
@@ -37,9 +58,13 @@ class WhatsAppClient:
             "type": "template",
             "template": {
                 "name": template_name,
-                "language": {"code": "en_US"},
+                "language": {"code": language or settings.template_default_language},
             },
         }
+        if parameters:
+            payload["template"]["components"] = [
+                {"type": "body", "parameters": [{"type": "text", "text": value} for value in parameters]}
+            ]
         headers = {"Authorization": f"Bearer {settings.whatsapp_access_token}"}
         async with httpx.AsyncClient(timeout=10) as client:
             response = await client.post(url, json=payload, headers=headers)
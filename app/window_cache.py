@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import time
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+from typing import Protocol
+
+import redis
+
+
+def _remaining_ms(last_inbound_at: datetime, window_hours: int) -> int:
+    if last_inbound_at.tzinfo is None:
+        last_inbound_at = last_inbound_at.replace(tzinfo=timezone.utc)
+    expires_at = last_inbound_at + timedelta(hours=window_hours)
+    return int((expires_at - datetime.now(timezone.utc)).total_seconds() * 1000)
+
+
+class FreeformWindowCache(Protocol):
+    def touch(self, wa_ids: Iterable[str], last_inbound_at: datetime) -> None:
+        ...
+
+    def is_open(self, wa_id: str) -> bool | None:
+        ...
+
+
+class RedisFreeformWindowCache:
+    """One key per user that expires when their 24h customer care window closes.
+
+    `is_open` returns None on a miss so callers fall back to the database.
+    """
+
+    def __init__(self, redis_client: redis.Redis, window_hours: int, key_prefix: str = "micai:freeform:"):
+        self.redis = redis_client
+        self.window_hours = window_hours
+        self.key_prefix = key_prefix
+
+    def touch(self, wa_ids: Iterable[str], last_inbound_at: datetime) -> None:
+        ttl_ms = _remaining_ms(last_inbound_at, self.window_hours)
+        if ttl_ms <= 0:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for wa_id in wa_ids:
+                pipe.set(f"{self.key_prefix}{wa_id}", "1", px=ttl_ms)
+            pipe.execute()
+        except redis.RedisError:
+            return
+
+    def is_open(self, wa_id: str) -> bool | None:
+        try:
+            ttl_ms = self.redis.pttl(f"{self.key_prefix}{wa_id}")
+        except redis.RedisError:
+            return None
+        return True if ttl_ms > 0 else None
+
+
+class InMemoryFreeformWindowCache:
+    def __init__(self, window_hours: int):
+        self.window_hours = window_hours
+        self.expires: dict[str, float] = {}
+
+    def touch(self, wa_ids: Iterable[str], last_inbound_at: datetime) -> None:
+        ttl_ms = _remaining_ms(last_inbound_at, self.window_hours)
+        if ttl_ms <= 0:
+            return
+        for wa_id in wa_ids:
+            self.expires[wa_id] = time.monotonic() + ttl_ms / 1000
+
+    def is_open(self, wa_id: str) -> bool | None:
+        expires = self.expires.get(wa_id)
+        return True if expires is not None and expires > time.monotonic() else None
@@ -1,35 +1,100 @@
 from __future__ import annotations
 
 import asyncio
+import logging
 
 from app.config import settings
-from app.jobs import enqueue_due_schedules, process_inbound_message, send_outbound_message
+from app.ingest import SPOOL_JOB_TYPE, ingest_envelope
+from app.jobs import (
+    enqueue_due_schedules,
+    process_inbound_message,
+    requeue_stuck_outbound_sends,
+    send_outbound_batch,
+    send_outbound_message,
+)
+from app.models import WebhookEnvelope
+from app.profiling import trace_job
+from app.queue import JobEnvelope
+from app.retention import prune_expired_rows
+from app.rule_cache import rule_cache
 from app.runtime import runtime
+from app.snapshot import load_snapshot_into_cache
 
+logger = logging.getLogger(__name__)
 
-async def handle_job(job_type: str, payload: dict) -> bool:
+
+async def handle_job(job_type: str, payload: dict, enqueued_at: float | None = None) -> bool:
+    with trace_job(job_type, enqueued_at):
+        return await _dispatch_job(job_type, payload)
+
+
+async def _dispatch_job(job_type: str, payload: dict) -> bool:
+    if job_type == "maintenance.prune":
+        prune_expired_rows(runtime.repo_scope)
+        return True
     with runtime.repo_scope() as repo:
         if job_type == "inbound.process_message":
             return process_inbound_message(repo, runtime.queue, payload)
         if job_type == "outbound.send_text":
             return await send_outbound_message(repo, payload)
+        if job_type == SPOOL_JOB_TYPE:
+            ingest_envelope(repo, runtime.queue, WebhookEnvelope.model_validate(payload))
+            return True
         if job_type == "scheduler.dispatch_due":
             enqueue_due_schedules(repo, runtime.queue)
             return True
+        if job_type == "maintenance.requeue_sends":
+            requeue_stuck_outbound_sends(repo, runtime.queue)
+            return True
     return False
 
 
+async def handle_outbound_batch(payloads: list[dict], enqueued_at: float | None = None) -> int:
+    with trace_job("outbound.send_text.batch", enqueued_at), runtime.repo_scope() as repo:
+        return await send_outbound_batch(repo, payloads)
+
+
+async def _run_isolated(job: JobEnvelope) -> None:
+    try:
+        await handle_job(job.job_type, job.payload, job.enqueued_at)
+    except Exception:
+        logger.exception("job %s failed", job.job_type)
+
+
+async def handle_jobs(jobs: list[JobEnvelope]) -> None:
+    """Run a dequeued batch; a failing job is logged so the rest of the batch still runs."""
+    outbound = [job for job in jobs if job.job_type == "outbound.send_text"]
+    for job in jobs:
+        if job.job_type != "outbound.send_text":
+            await _run_isolated(job)
+    if len(outbound) > 1:
+        oldest = min((job.enqueued_at for job in outbound if job.enqueued_at is not None), default=None)
+        try:
+            await handle_outbound_batch([job.payload for job in outbound], oldest)
+            return
+        except Exception:
+            # Claims are committed before anything is sent, so keys the batch already claimed are
+            # skipped by the per-job retry until their lease expires; only unclaimed jobs are sent.
+            logger.exception("outbound batch of %s failed, retrying unclaimed jobs individually", len(outbound))
+    for job in outbound:
+        await _run_isolated(job)
+
+
 async def worker_loop() -> None:
     runtime.initialize()
     if runtime.redis_queue is None:
         return
+    rule_cache.redis = runtime.redis
+    load_snapshot_into_cache()
 
     while True:
-        job = runtime.redis_queue.dequeue(settings.queue_poll_timeout_seconds)
-        if job is None:
+        jobs = runtime.redis_queue.dequeue_batch(
+            settings.queue_poll_timeout_seconds, settings.worker_outbound_batch_size
+        )
+        if not jobs:
             await asyncio.sleep(0.05)
             continue
-        await handle_job(job.job_type, job.payload)
+        await handle_jobs(jobs)
 
 
 def main() -> None:
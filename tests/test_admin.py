@@ -0,0 +1,116 @@
+import json
+
+from fastapi.testclient import TestClient
+
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.db_models import Base
+from app.main import app
+from app.models import AgentRule
+from app.repository import Repository
+from app.rule_cache import MAX_AGE_TTLS, rule_cache
+
+client = TestClient(app)
+ADMIN_HEADERS = {"x-admin-key": "dev-admin-key"}
+
+
+def setup_function() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
+
+
+def _rule(rule_id: str, reply_text: str) -> dict:
+    return {
+        "id": rule_id,
+        "agent_id": "agent-1",
+        "rule_type": "keyword",
+        "keywords": ["weather"],
+        "reply_text": reply_text,
+    }
+
+
+def test_bulk_rules_ndjson_upserts_in_chunks_and_reports_errors(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "admin_bulk_chunk_size", 2)
+    lines = [
+        json.dumps(_rule("rule-1", "old")),
+        json.dumps(_rule("rule-2", "two")),
+        '{"id": "broken"',
+        json.dumps({**_rule("rule-3", "three"), "rule_type": "nope"}),
+        json.dumps(_rule("rule-1", "new")),
+    ]
+
+    response = client.post(
+        "/admin/rules/bulk",
+        content="\n".join(lines) + "\n",
+        headers={**ADMIN_HEADERS, "content-type": "application/x-ndjson"},
+    )
+
+    body = response.json()
+    assert body["upserted"] == 3
+    assert [error["index"] for error in body["errors"]] == [2, 3]
+    with SessionLocal() as session:
+        rules = Repository(session).get_rules_for_agent("agent-1")
+    assert {rule.id: rule.reply_text for rule in rules} == {"rule-1": "new", "rule-2": "two"}
+
+
+def test_bulk_bindings_json_array() -> None:
+    with SessionLocal() as session:
+        Repository(session).touch_user_inbound("15550000001")
+        session.commit()
+
+    response = client.post(
+        "/admin/bindings/bulk",
+        json=[
+            {"wa_id": "15550000001", "agent_id": "agent-1"},
+            {"wa_id": "15550000002", "agent_id": "agent-2"},
+            {"wa_id": "15550000003"},
+        ],
+        headers=ADMIN_HEADERS,
+    )
+
+    assert response.json()["upserted"] == 2
+    assert response.json()["errors"] == [{"index": 2, "error": "agent_id: Field required"}]
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert repo.get_agent_id_for_user("15550000001") == "agent-1"
+        assert repo.get_agent_id_for_user("15550000002") == "agent-2"
+        assert repo.get_last_inbound_at("15550000001") is not None
+
+
+def test_moving_rule_between_agents_refreshes_both_cached_sets(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "rule_cache_ttl_seconds", 3600)
+    client.post("/admin/rules", json=_rule("rule-1", "hi"), headers=ADMIN_HEADERS)
+    client.post("/admin/rules/bulk", json=[_rule("rule-2", "two")], headers=ADMIN_HEADERS)
+    with SessionLocal() as session:
+        assert len(rule_cache.get(Repository(session), "agent-1").rules) == 2
+
+    client.post("/admin/rules", json={**_rule("rule-1", "hi"), "agent_id": "agent-2"}, headers=ADMIN_HEADERS)
+    client.post(
+        "/admin/rules/bulk", json=[{**_rule("rule-2", "two"), "agent_id": "agent-2"}], headers=ADMIN_HEADERS
+    )
+
+    with SessionLocal() as session:
+        assert rule_cache.get(Repository(session), "agent-1").rules == []
+
+
+def test_unchanged_version_does_not_extend_cache_past_max_age(monkeypatch) -> None:
+    class Versions:
+        def hget(self, key: str, agent_id: str) -> int:
+            return 0
+
+    clock = [1000.0]
+    monkeypatch.setattr("app.rule_cache.time.monotonic", lambda: clock[0])
+    monkeypatch.setattr(settings, "rule_cache_ttl_seconds", 60)
+    monkeypatch.setattr(rule_cache, "redis", Versions())
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert rule_cache.get(repo, "agent-1").rules == []
+        # Written while Redis was unreachable: no version bump reaches this worker.
+        repo.upsert_rule(AgentRule.model_validate(_rule("rule-1", "hi")))
+        session.commit()
+
+        clock[0] += 61
+        assert rule_cache.get(repo, "agent-1").rules == []
+        clock[0] += 60 * MAX_AGE_TTLS
+        assert [rule.id for rule in rule_cache.get(repo, "agent-1").rules] == ["rule-1"]
@@ -1,16 +1,30 @@
+import json
 from datetime import datetime, timedelta, timezone
 
-from app.db import SessionLocal, engine
-from app.db_models import Base, UserAgentBindingRow
-from app.jobs import process_inbound_message, send_outbound_message
-from app.models import AgentRule, IncomingMessage, RuleAction, RuleType
-from app.queue import InMemoryJobQueue
+from app.config import settings
+from app.db import SessionLocal, engine, session_scope
+from app.db_models import AgentRuleRow, Base, OutboundSendRow, ScheduleRow, UserAgentBindingRow
+from app.jobs import (
+    enqueue_due_schedules,
+    process_inbound_message,
+    requeue_stuck_outbound_sends,
+    send_outbound_batch,
+    send_outbound_message,
+)
+from app.models import AgentRule, AgentSettings, IncomingMessage, RuleAction, RuleType
+from app.queue import InMemoryJobQueue, JobEnvelope
 from app.repository import Repository
+from app.rule_cache import rule_cache
+from app.rules import match_rule, normalize
+from app.templates import template_registry
+from app.window_cache import InMemoryFreeformWindowCache
+from app.worker import handle_jobs
 
 
 def setup_function() -> None:
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
 
 
 def test_process_inbound_enqueues_outbound() -> None:
@@ -50,6 +64,30 @@ def test_process_inbound_enqueues_outbound() -> None:
     assert queue.items[0].payload["body"] == "Sunny today"
 
 
+def test_agent_invoke_prefixes_override_defaults() -> None:
+    queue = InMemoryJobQueue()
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.bind_user_agent("15550000003", "agent-2")
+        repo.upsert_agent_settings(AgentSettings(agent_id="agent-2", invoke_prefixes=["Hey Mic", "!mic"]))
+        session.commit()
+
+    def process(message_id: str, text: str) -> bool:
+        with SessionLocal() as session:
+            ok = process_inbound_message(
+                Repository(session),
+                queue,
+                IncomingMessage(message_id=message_id, wa_id="15550000003", text=text).model_dump(),
+            )
+            session.commit()
+        return ok
+
+    assert process("wamid.3", "michael: hello") is False
+    assert process("wamid.4", "hey   mic what's up") is True
+    assert process("wamid.5", "just chatting") is False
+    assert len(queue.items) == 1
+
+
 def test_outbound_uses_template_when_out_of_window(monkeypatch) -> None:
     calls: dict[str, str | None] = {"text": None, "template": None}
 
@@ -57,7 +95,7 @@ def test_outbound_uses_template_when_out_of_window(monkeypatch) -> None:
         calls["text"] = f"{wa_id}:{text}"
         return "text-id"
 
-    async def fake_send_template(wa_id: str, template_name: str) -> str:
+    async def fake_send_template(wa_id: str, template_name: str, **kwargs: object) -> str:
         calls["template"] = f"{wa_id}:{template_name}"
         return "tpl-id"
 
@@ -93,3 +131,388 @@ def test_outbound_uses_template_when_out_of_window(monkeypatch) -> None:
 
     assert calls["text"] is None
     assert calls["template"] == "15550000002:out_of_window_default"
+
+
+def test_touch_users_inbound_only_moves_forward() -> None:
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.touch_users_inbound(["15550000004", "15550000004", "15550000005"], now=now)
+        repo.touch_users_inbound(["15550000004"], now=now - timedelta(hours=1))
+        session.commit()
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert repo.can_send_freeform("15550000004", 24, now=now + timedelta(hours=23, minutes=59))
+        assert not repo.can_send_freeform("15550000004", 24, now=now + timedelta(hours=24, minutes=1))
+        assert repo.get_agent_id_for_user("15550000005") == "default-agent"
+
+
+def test_freeform_window_cache_skips_db_read() -> None:
+    cache = InMemoryFreeformWindowCache(window_hours=24)
+    with SessionLocal() as session:
+        Repository(session, window_cache=cache).touch_user_inbound("15550000006")
+        session.commit()
+
+    with SessionLocal() as session:
+        session.get(UserAgentBindingRow, "15550000006").last_inbound_at = None
+        session.commit()
+
+    with SessionLocal() as session:
+        assert Repository(session, window_cache=cache).can_send_freeform("15550000006", 24)
+        assert not Repository(session).can_send_freeform("15550000006", 24)
+        assert cache.is_open("15550000007") is None
+
+    with SessionLocal() as session:
+        repo = Repository(session, window_cache=cache)
+        repo.touch_user_inbound("15550000007")
+        repo.touch_users_inbound(["15550000007"])
+        assert cache.is_open("15550000007") is None
+        session.rollback()
+    assert cache.is_open("15550000007") is None
+
+
+def test_outbound_batch_claims_once_and_records_results(monkeypatch) -> None:
+    async def fake_send_text(wa_id: str, text: str) -> str:
+        if text == "boom":
+            raise RuntimeError("provider error")
+        return f"id-{text}"
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", fake_send_text)
+
+    def payload(key: str, body: str) -> dict:
+        return {"idempotency_key": key, "wa_id": "15550000008", "body": body, "template_name": None}
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.touch_user_inbound("15550000008")
+        assert repo.try_start_outbound_send("k0", "15550000008", "done", None, lease_seconds=120, max_attempts=5)
+        session.commit()
+
+    with SessionLocal() as session:
+        import asyncio
+
+        sent = asyncio.run(
+            send_outbound_batch(
+                Repository(session),
+                [payload("k0", "done"), payload("k1", "one"), payload("k1", "one"), payload("k2", "boom")],
+            )
+        )
+        session.commit()
+
+    assert sent == 1
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k0").status == "sending"
+        assert session.get(OutboundSendRow, "k1").status == "sent"
+        assert session.get(OutboundSendRow, "k1").provider_message_id == "id-one"
+        assert session.get(OutboundSendRow, "k2").status == "failed"
+        assert session.get(OutboundSendRow, "k2").last_error == "provider error"
+
+
+def test_legacy_keywords_are_migrated_and_normalized() -> None:
+    with SessionLocal() as session:
+        session.add(
+            AgentRuleRow(
+                id="rule-legacy",
+                agent_id="agent-1",
+                rule_type="keyword",
+                enabled=True,
+                priority=1,
+                keywords_csv=" Weather |FORECAST|weather",
+                action="reply_text",
+                reply_text="Sunny",
+            )
+        )
+        session.commit()
+
+    with SessionLocal() as session:
+        assert Repository(session).migrate_legacy_keywords() == 1
+        session.commit()
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert repo.migrate_legacy_keywords() == 0
+        assert repo.get_rules_for_agent("agent-1")[0].keywords == ["forecast", "weather"]
+
+
+def test_candidate_filter_fetches_only_matching_keyword_rules(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "rule_candidate_filter_min_rules", 2)
+    queue = InMemoryJobQueue()
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.bind_user_agent("15550000009", "agent-big")
+        repo.upsert_rules(
+            [
+                AgentRule(
+                    id=f"rule-{keyword}",
+                    agent_id="agent-big",
+                    rule_type=RuleType.KEYWORD,
+                    keywords=[keyword.upper()],
+                    reply_text=f"About {keyword}",
+                    priority=index,
+                )
+                for index, keyword in enumerate(["news", "weather", "traffic report"])
+            ]
+        )
+        session.commit()
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        candidates = repo.get_candidate_rules("agent-big", "/ask weather and traffic report?")
+        assert [rule.id for rule in candidates] == ["rule-weather", "rule-traffic report"]
+        assert process_inbound_message(
+            repo,
+            queue,
+            IncomingMessage(message_id="wamid.9", wa_id="15550000009", text="/ask Weather?").model_dump(),
+        )
+        assert rule_cache.get(repo, "agent-big").candidate_filter
+        session.commit()
+
+    assert queue.items[0].payload["body"] == "About weather"
+
+
+def test_template_sends_are_validated_before_network_call(monkeypatch, tmp_path) -> None:
+    registry = tmp_path / "templates.json"
+    registry.write_text(
+        json.dumps({"templates": [{"name": "daily_digest", "languages": ["es_MX", "en_US"], "parameters": 1}]}),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(settings, "template_registry_file", str(registry))
+    template_registry.cache_clear()
+    calls: list[tuple] = []
+
+    async def fake_send_template(wa_id: str, template_name: str, language: str, parameters: list[str]) -> str:
+        calls.append((template_name, language, parameters))
+        return "tpl-id"
+
+    monkeypatch.setattr("app.jobs.wa_client.send_template", fake_send_template)
+    queue = InMemoryJobQueue()
+    with SessionLocal() as session:
+        for schedule_id, template_name in (("s-ok", "daily_digest"), ("s-bad", "unknown_template")):
+            session.add(
+                ScheduleRow(
+                    id=schedule_id,
+                    wa_id="15550000010",
+                    agent_id="agent-1",
+                    message_text="digest",
+                    template_name=template_name,
+                    template_parameters_json='["Ana"]',
+                    interval_minutes=60,
+                    next_run_at=datetime.now(timezone.utc) - timedelta(minutes=1),
+                )
+            )
+        session.commit()
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert enqueue_due_schedules(repo, queue) == 1
+        import asyncio
+
+        assert asyncio.run(send_outbound_message(repo, queue.items[0].payload)) is True
+        bad = {"idempotency_key": "k-bad", "wa_id": "15550000010", "body": "", "template_name": "daily_digest"}
+        assert asyncio.run(send_outbound_message(repo, bad)) is False
+        session.commit()
+        assert session.get(OutboundSendRow, "k-bad").last_error == (
+            "Template 'daily_digest' expects 1 parameters, got 0"
+        )
+
+    template_registry.cache_clear()
+    assert calls == [("daily_digest", "en_US", ["Ana"])]
+
+
+def test_expired_send_lease_is_reclaimed_and_requeued(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "queue_max_attempts", 3)
+    now = datetime.now(timezone.utc)
+    claim = {"lease_seconds": 60, "max_attempts": 3}
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert repo.try_start_outbound_send("k-lease", "15550000011", "hi", None, now=now, **claim)
+        assert not repo.try_start_outbound_send("k-lease", "15550000011", "hi", None, now=now, **claim)
+        later = now + timedelta(seconds=61)
+        assert repo.try_start_outbound_send("k-lease", "15550000011", "hi", None, now=later, **claim)
+        assert repo.try_start_outbound_sends(
+            [{"idempotency_key": "k-stuck", "wa_id": "15550000011", "body": "again"}], now=now, **claim
+        ) == {"k-stuck"}
+        session.commit()
+
+    with SessionLocal() as session:
+        row = session.get(OutboundSendRow, "k-lease")
+        assert (row.status, row.attempts) == ("sending", 2)
+        session.get(OutboundSendRow, "k-stuck").lease_expires_at = now - timedelta(seconds=1)
+        row.lease_expires_at = now - timedelta(seconds=1)
+        row.attempts = 3
+        session.commit()
+
+    queue = InMemoryJobQueue()
+    with SessionLocal() as session:
+        assert requeue_stuck_outbound_sends(Repository(session), queue) == 1
+        assert requeue_stuck_outbound_sends(Repository(session), queue) == 0
+        session.commit()
+
+    assert [item.payload["body"] for item in queue.items] == ["again"]
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k-lease").status == "failed"
+        assert session.get(OutboundSendRow, "k-stuck").status == "pending"
+        repo = Repository(session)
+        assert repo.try_start_outbound_sends([queue.items[0].payload], **claim) == {"k-stuck"}
+        session.commit()
+        assert session.get(OutboundSendRow, "k-stuck").attempts == 2
+
+
+def test_crash_between_claim_and_result_leaves_a_reclaimable_lease(monkeypatch) -> None:
+    import asyncio
+
+    class WorkerKilled(BaseException):
+        pass
+
+    sent: list[str] = []
+
+    async def crashing_send_text(wa_id: str, text: str) -> str:
+        raise WorkerKilled
+
+    async def fake_send_text(wa_id: str, text: str) -> str:
+        sent.append(text)
+        return f"id-{text}"
+
+    async def failing_send_text(wa_id: str, text: str) -> str:
+        raise RuntimeError("provider timeout")
+
+    with SessionLocal() as session:
+        session.add(
+            UserAgentBindingRow(wa_id="15550000012", agent_id="agent-1", last_inbound_at=datetime.now(timezone.utc))
+        )
+        session.commit()
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", crashing_send_text)
+    payload = {"idempotency_key": "k-crash", "wa_id": "15550000012", "body": "hi", "template_name": None}
+    try:
+        with session_scope() as session:
+            asyncio.run(send_outbound_message(Repository(session), payload))
+    except WorkerKilled:
+        pass
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", fake_send_text)
+    with SessionLocal() as session:
+        row = session.get(OutboundSendRow, "k-crash")
+        assert (row.status, row.attempts) == ("sending", 1)
+        assert row.lease_expires_at is not None
+        assert asyncio.run(send_outbound_message(Repository(session), payload)) is False
+        row.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+        session.commit()
+
+    queue = InMemoryJobQueue()
+    with session_scope() as session:
+        assert requeue_stuck_outbound_sends(Repository(session), queue) == 1
+    with session_scope() as session:
+        assert asyncio.run(send_outbound_message(Repository(session), queue.items[0].payload)) is True
+    assert sent == ["hi"]
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", failing_send_text)
+    failing = {**payload, "idempotency_key": "k-timeout"}
+    try:
+        with session_scope() as session:
+            asyncio.run(send_outbound_message(Repository(session), failing))
+    except RuntimeError:
+        pass
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k-crash").status == "sent"
+        row = session.get(OutboundSendRow, "k-timeout")
+        assert (row.status, row.last_error) == ("failed", "provider timeout")
+
+def test_failing_job_does_not_drop_rest_of_batch(monkeypatch) -> None:
+    sent: list[str] = []
+
+    async def fake_send_text(wa_id: str, text: str) -> str:
+        sent.append(text)
+        return f"id-{text}"
+
+    def fake_process_inbound(repo: Repository, queue: InMemoryJobQueue, payload: dict) -> bool:
+        raise RuntimeError("poison message")
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", fake_send_text)
+    monkeypatch.setattr("app.worker.process_inbound_message", fake_process_inbound)
+    with SessionLocal() as session:
+        Repository(session).touch_user_inbound("15550000012")
+        session.commit()
+
+    def outbound(key: str, body: object) -> JobEnvelope:
+        payload = {"idempotency_key": key, "wa_id": "15550000012", "body": body, "template_name": None}
+        return JobEnvelope(job_type="outbound.send_text", payload=payload)
+
+    jobs = [
+        JobEnvelope(job_type="inbound.process_message", payload={}),
+        outbound("k-a", "one"),
+        outbound("k-b", "two"),
+        JobEnvelope(job_type="outbound.send_text", payload={"unexpected": True}),
+    ]
+    import asyncio
+
+    asyncio.run(handle_jobs(jobs))
+
+    assert sent == ["one", "two"]
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k-a").status == "sent"
+        assert session.get(OutboundSendRow, "k-b").status == "sent"
+
+
+def test_batch_failure_after_sending_does_not_resend(monkeypatch) -> None:
+    sent: list[str] = []
+
+    async def fake_send_text(wa_id: str, text: str) -> str:
+        sent.append(text)
+        return f"id-{text}"
+
+    def broken_mark_results(self: Repository, sent: dict, failed: dict) -> None:
+        raise RuntimeError("db went away")
+
+    monkeypatch.setattr("app.jobs.wa_client.send_text", fake_send_text)
+    monkeypatch.setattr(Repository, "mark_outbound_results", broken_mark_results)
+    with SessionLocal() as session:
+        Repository(session).touch_user_inbound("15550000013")
+        session.commit()
+
+    jobs = [
+        JobEnvelope(
+            job_type="outbound.send_text",
+            payload={"idempotency_key": f"k-{body}", "wa_id": "15550000013", "body": body, "template_name": None},
+        )
+        for body in ("a", "b")
+    ]
+    import asyncio
+
+    asyncio.run(handle_jobs(jobs))
+
+    assert sent == ["a", "b"]
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k-a").status == "sending"
+
+
+def test_candidate_filter_agrees_with_in_memory_matching() -> None:
+    keywords = ["weather", "please send me the traffic report", "news"]
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.upsert_rules(
+            [
+                AgentRule(
+                    id=f"rule-{index}",
+                    agent_id="agent-big",
+                    rule_type=RuleType.KEYWORD,
+                    keywords=[keyword],
+                    reply_text=keyword,
+                    priority=index,
+                )
+                for index, keyword in enumerate(keywords)
+            ]
+        )
+        session.commit()
+
+    with SessionLocal() as session:
+        repo = Repository(session)
+        all_rules = repo.get_rules_for_agent("agent-big")
+        messages = ("the weatherman says hi", "could you please send me the traffic report now", "newsletter", "hi")
+        for text in messages:
+            normalized = normalize(text)
+            in_memory = match_rule(text, all_rules, normalized=normalized)
+            filtered = match_rule(text, repo.get_candidate_rules("agent-big", normalized), normalized=normalized)
+            assert (filtered and filtered.id) == (in_memory and in_memory.id), text
+            assert (in_memory is None) == (text == "hi")
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app.db_models import Base
+from app.migrate import upgrade_schema
+from app.repository import Repository
+
+# Tables as the baseline release created them, before later columns and indexes were added.
+BASELINE_TABLES = {
+    "schedules": """
+        CREATE TABLE schedules (
+            id VARCHAR(64) NOT NULL PRIMARY KEY,
+            wa_id VARCHAR(64) NOT NULL,
+            agent_id VARCHAR(64) NOT NULL,
+            message_text TEXT NOT NULL,
+            template_name VARCHAR(128),
+            interval_minutes INTEGER NOT NULL,
+            next_run_at DATETIME NOT NULL,
+            enabled BOOLEAN NOT NULL
+        )
+    """,
+    "outbound_sends": """
+        CREATE TABLE outbound_sends (
+            idempotency_key VARCHAR(160) NOT NULL PRIMARY KEY,
+            wa_id VARCHAR(64) NOT NULL,
+            body TEXT NOT NULL,
+            template_name VARCHAR(128),
+            status VARCHAR(24) NOT NULL,
+            attempts INTEGER NOT NULL,
+            provider_message_id VARCHAR(128),
+            last_error TEXT,
+            created_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL,
+            updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP) NOT NULL
+        )
+    """,
+}
+
+
+def _baseline_engine(tmp_path):
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        for table_name, ddl in BASELINE_TABLES.items():
+            connection.execute(text(f"DROP TABLE {table_name}"))
+            connection.execute(text(ddl))
+    return engine
+
+
+def test_upgrade_adds_missing_indexes_once(tmp_path) -> None:
+    engine = create_engine(f"sqlite+pysqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_outbound_sends_provider_message_id"))
+        connection.execute(text("DROP INDEX ix_conversation_turns_created_at"))
+
+    assert sorted(upgrade_schema(engine)) == [
+        "ix_conversation_turns_created_at",
+        "ix_outbound_sends_provider_message_id",
+    ]
+    assert upgrade_schema(engine) == []
+    indexes = {index["name"]: index for index in inspect(engine).get_indexes("outbound_sends")}
+    assert indexes["ix_outbound_sends_provider_message_id"]["unique"]
+
+
+def test_upgrade_adds_columns_to_baseline_tables(tmp_path) -> None:
+    engine = _baseline_engine(tmp_path)
+    due = datetime.now(timezone.utc) - timedelta(minutes=1)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "INSERT INTO outbound_sends (idempotency_key, wa_id, body, status, attempts)"
+                " VALUES ('k-old', '15550000001', 'hi', 'sending', 1)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO schedules (id, wa_id, agent_id, message_text, interval_minutes, next_run_at, enabled)"
+                " VALUES ('s-old', '15550000001', 'agent-1', 'digest', 60, :due, 1)"
+            ),
+            {"due": due.strftime("%Y-%m-%d %H:%M:%S.%f")},
+        )
+
+    applied = upgrade_schema(engine)
+
+    assert {
+        "schedules.template_language",
+        "schedules.template_parameters_json",
+        "outbound_sends.lease_expires_at",
+        "ix_outbound_sends_lease_expires_at",
+        "ix_outbound_sends_provider_message_id",
+    } <= set(applied)
+    assert upgrade_schema(engine) == []
+    with Session(engine) as session:
+        repo = Repository(session)
+        [schedule] = repo.list_due_schedules()
+        assert (schedule.template_language, schedule.template_parameters_json) == (None, "[]")
+        claim = {"lease_seconds": 60, "max_attempts": 5}
+        # A pre-lease "sending" row has no expiry, so a redelivered job may take it over.
+        assert repo.try_start_outbound_send("k-old", "15550000001", "hi", None, **claim)
+        assert repo.try_start_outbound_send("k-new", "15550000001", "hi", None, **claim)
+        session.commit()
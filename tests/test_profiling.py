@@ -0,0 +1,35 @@
+import asyncio
+import logging
+
+from app.config import settings
+from app.db import engine
+from app.db_models import Base
+from app.models import IncomingMessage
+from app.queue import InMemoryJobQueue
+from app.rule_cache import rule_cache
+from app.runtime import runtime
+from app.worker import handle_job
+
+
+def setup_function() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
+    runtime.set_test_queue(InMemoryJobQueue())
+
+
+def test_slow_job_logs_phase_breakdown_and_dumps_profile(monkeypatch, tmp_path, caplog) -> None:
+    monkeypatch.setattr(settings, "job_trace_enabled", True)
+    monkeypatch.setattr(settings, "job_slow_threshold_ms", 0)
+    monkeypatch.setattr(settings, "job_profile_sample_rate", 1)
+    monkeypatch.setattr(settings, "job_profile_dir", str(tmp_path))
+    payload = IncomingMessage(message_id="wamid.1", wa_id="15550000001", text="/ask weather").model_dump()
+
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        assert asyncio.run(handle_job("inbound.process_message", payload)) is True
+
+    message = caplog.records[-1].getMessage()
+    assert message.startswith("slow job inbound.process_message took")
+    for phase in ("decode=", "session_open=", "repo.touch_user_inbound=", "match=", "commit="):
+        assert phase in message
+    assert len(list(tmp_path.glob("inbound.process_message-*.prof"))) == 1
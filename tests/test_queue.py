@@ -0,0 +1,76 @@
+import json
+
+from app.queue import LANES, RedisJobQueue
+
+
+class ListRedis:
+    """Just enough of the Redis list API for RedisJobQueue."""
+
+    def __init__(self) -> None:
+        self.lists: dict[str, list[str]] = {}
+
+    def lpush(self, key: str, value: str) -> None:
+        self.lists.setdefault(key, []).insert(0, value)
+
+    def brpop(self, keys: list[str], timeout: int) -> tuple[str, str] | None:
+        for key in keys:
+            if self.lists.get(key):
+                return key, self.lists[key].pop()
+        return None
+
+    def rpop(self, key: str, count: int) -> list[str] | None:
+        items = self.lists.get(key, [])
+        popped = [items.pop() for _ in range(min(count, len(items)))]
+        return popped or None
+
+    def llen(self, key: str) -> int:
+        return len(self.lists.get(key, []))
+
+    def lindex(self, key: str, index: int) -> str | None:
+        items = self.lists.get(key, [])
+        return items[index] if items else None
+
+    def pipeline(self, transaction: bool = False) -> "ListPipeline":
+        return ListPipeline(self)
+
+
+class ListPipeline:
+    def __init__(self, redis_client: ListRedis) -> None:
+        self.redis = redis_client
+        self.results: list = []
+
+    def llen(self, key: str) -> None:
+        self.results.append(self.redis.llen(key))
+
+    def lindex(self, key: str, index: int) -> None:
+        self.results.append(self.redis.lindex(key, index))
+
+    def execute(self) -> list:
+        return self.results
+
+
+def test_lower_lanes_are_served_under_sustained_outbound_load() -> None:
+    queue = RedisJobQueue(ListRedis())
+    queue.enqueue("maintenance.requeue_sends", {})
+    queue.enqueue("scheduler.tick", {})
+    served = []
+    for turn in range(2 * len(queue.keys)):
+        queue.enqueue("outbound.send_text", {"turn": turn})
+        served.append(queue.dequeue(timeout_seconds=0).job_type)
+
+    assert "maintenance.requeue_sends" in served
+    assert "scheduler.tick" in served
+    assert served.count("outbound.send_text") >= len(queue.keys)
+
+
+def test_stats_count_the_legacy_list() -> None:
+    redis_client = ListRedis()
+    queue = RedisJobQueue(redis_client)
+    redis_client.lpush("micai:jobs", json.dumps({"job_type": "outbound.send_text", "payload": {}, "enqueued_at": 1.0}))
+    queue.enqueue("other.thing", {})
+
+    stats = queue.stats()
+    assert set(stats) == set(LANES)
+    assert stats["default"]["depth"] == 2
+    assert stats["default"]["oldest_age_seconds"] > 0
+    assert sum(lane["depth"] for lane in stats.values()) == 2
@@ -0,0 +1,80 @@
+import asyncio
+import os
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app.capture import read_captures, webhook_capture
+from app.config import settings
+from app.db import engine
+from app.db_models import Base
+from app.main import app
+from app.queue import InMemoryJobQueue
+from app.replay import parse_speed, replay
+from app.rule_cache import rule_cache
+from app.runtime import runtime
+
+client = TestClient(app)
+
+
+def setup_function() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
+    runtime.set_test_queue(InMemoryJobQueue())
+
+
+def _envelope(message_id: str) -> dict:
+    message = {"id": message_id, "from": "15550000030", "type": "text", "text": {"body": "/ask weather"}}
+    # Not extracted by the webhook, so it must not be reported as a duplicate either.
+    image = {"id": f"{message_id}.img", "from": "15550000030", "type": "image", "image": {"id": "media-1"}}
+    value = {"messages": [message, image]}
+    return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": value}]}]}
+
+
+def test_captured_traffic_replays_with_dedup_stats(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(settings, "webhook_capture_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "webhook_capture_max_bytes", 1)
+    for message_id in ("wamid.30", "wamid.31", "wamid.30"):
+        client.post("/webhook", json=_envelope(message_id))
+    webhook_capture().close()
+    monkeypatch.setattr(settings, "webhook_capture_dir", None)
+
+    files = sorted(str(path) for path in tmp_path.glob("webhook-*.jsonl.gz"))
+    assert len(files) == 3
+    assert all(f"-{os.getpid()}-" in path for path in files)
+    records = list(read_captures(files))
+    assert [record["body"]["entry"][0]["changes"][0]["value"]["messages"][0]["id"] for record in records] == [
+        "wamid.30",
+        "wamid.31",
+        "wamid.30",
+    ]
+
+    setup_function()
+    report = asyncio.run(
+        replay(records, "http://testserver/webhook", speed=None, concurrency=1, transport=httpx.ASGITransport(app=app))
+    )
+
+    assert report["envelopes"] == 3
+    assert report["http_200"] == 3
+    assert report["messages"] == 6
+    assert report["claimed"] == 2
+    assert report["duplicates"] == 1
+
+
+def test_capture_keeps_raw_body_and_survives_bad_envelope(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(settings, "webhook_capture_dir", str(tmp_path))
+    body = {**_envelope("wamid.32"), "unmodelled": {"kept": True}}
+    capture = webhook_capture()
+    capture.write(b"{not json")
+    client.post("/webhook", json=body)
+    capture.close()
+    monkeypatch.setattr(settings, "webhook_capture_dir", None)
+
+    records = list(read_captures(str(path) for path in tmp_path.glob("webhook-*.jsonl.gz")))
+    assert [record["body"] for record in records] == [body]
+
+
+def test_parse_speed() -> None:
+    assert parse_speed("10x") == 10.0
+    assert parse_speed("max") is None
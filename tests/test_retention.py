@@ -0,0 +1,56 @@
+import gzip
+import json
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.db_models import Base, ConversationTurnRow, InboundDedupRow, OutboundSendRow
+from app.repository import Repository
+from app.retention import prune_expired_rows
+
+
+def setup_function() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@contextmanager
+def repo_scope() -> Iterator[Repository]:
+    with SessionLocal() as session:
+        yield Repository(session)
+        session.commit()
+
+
+def test_prune_deletes_old_rows_in_batches_and_exports(monkeypatch, tmp_path) -> None:
+    monkeypatch.setattr(settings, "retention_batch_size", 2)
+    monkeypatch.setattr(settings, "retention_export_dir", str(tmp_path))
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=100)
+
+    with SessionLocal() as session:
+        for index in range(5):
+            session.add(InboundDedupRow(message_id=f"old-{index}", wa_id="1", text="hi", created_at=old))
+        session.add(InboundDedupRow(message_id="new", wa_id="1", text="hi", created_at=now))
+        session.add(OutboundSendRow(idempotency_key="old", wa_id="1", status="sent", created_at=old))
+        session.add(ConversationTurnRow(wa_id="1", inbound_text="a", outbound_text="b", created_at=now))
+        session.commit()
+
+    report = prune_expired_rows(repo_scope, now=now)
+
+    assert report == {
+        "inbound_dedup": 5,
+        "outbound_sends": 1,
+        "conversation_turns": 0,
+        "pending_delivery_statuses": 0,
+    }
+    with SessionLocal() as session:
+        assert [row.message_id for row in session.query(InboundDedupRow)] == ["new"]
+        assert session.query(OutboundSendRow).count() == 0
+        assert session.query(ConversationTurnRow).count() == 1
+
+    exported = next(tmp_path.glob("inbound_dedup-*.jsonl.gz"))
+    with gzip.open(exported, "rt", encoding="utf-8") as handle:
+        ids = [json.loads(line)["message_id"] for line in handle]
+    assert sorted(ids) == [f"old-{index}" for index in range(5)]
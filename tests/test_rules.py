@@ -1,5 +1,5 @@
 from app.models import AgentRule, RuleAction, RuleType
-from app.rules import match_rule
+from app.rules import compile_invoke_gate, match_rule, split_prefixes
 
 
 def test_prefix_rule_matches_first() -> None:
@@ -43,3 +43,12 @@ def test_keyword_rule_matches_contains() -> None:
     rule = match_rule("Can you share weather now?", rules)
     assert rule is not None
     assert rule.id == "r2"
+
+
+def test_invoke_gate_matches_normalized_prefixes() -> None:
+    gate = compile_invoke_gate(split_prefixes(" Michael: ,@michael,,/ask"))
+    assert gate.prefixes == ("michael:", "@michael", "/ask")
+    assert gate.matches("michael: weather")
+    assert gate.matches("/ask something")
+    assert not gate.matches("hey michael: weather")
+    assert not compile_invoke_gate(()).matches("michael: weather")
@@ -0,0 +1,79 @@
+import json
+
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.db_models import Base
+from app.models import AgentRule, AgentSettings, RuleAction, RuleType
+from app.repository import Repository
+from app.rule_cache import rule_cache
+from app.snapshot import (
+    build_snapshot,
+    load_snapshot_into_cache,
+    read_snapshot,
+    snapshot_rule_sets,
+    write_snapshot,
+)
+
+
+def setup_function() -> None:
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
+
+
+def test_snapshot_round_trip_warms_cache_without_db(tmp_path) -> None:
+    with SessionLocal() as session:
+        repo = Repository(session)
+        repo.upsert_agent_settings(AgentSettings(agent_id="agent-2", invoke_prefixes=["hey mic"]))
+        for rule_id, enabled in (("rule-1", True), ("rule-2", False)):
+            repo.upsert_rule(
+                AgentRule(
+                    id=rule_id,
+                    agent_id="agent-1",
+                    rule_type=RuleType.KEYWORD,
+                    enabled=enabled,
+                    keywords=["weather"],
+                    action=RuleAction.REPLY_TEXT,
+                    reply_text="Sunny today",
+                )
+            )
+        session.commit()
+        snapshot = build_snapshot(repo, versions={"agent-1": 3})
+
+    path = str(tmp_path / "rules.json")
+    write_snapshot(snapshot, path=path)
+    assert rule_cache.load(snapshot_rule_sets(read_snapshot(path=path))) == 2
+
+    Base.metadata.drop_all(bind=engine)
+    with SessionLocal() as session:
+        rule_set = rule_cache.get(Repository(session), "agent-1")
+        assert [rule.id for rule in rule_set.rules] == ["rule-1"]
+        assert rule_set.version == 3
+        assert rule_cache.get(Repository(session), "agent-2").gate.matches("hey mic hello")
+        assert rule_cache.any_gate(Repository(session)).matches("hey mic hello")
+
+
+def test_snapshot_skips_agents_changed_since_export(monkeypatch) -> None:
+    class Versions:
+        def hgetall(self, key: str) -> dict[str, str]:
+            return {"agent-1": "4", "agent-2": "1"}
+
+    monkeypatch.setattr(rule_cache, "redis", Versions())
+    snapshot = {
+        "format": 1,
+        "agents": {
+            "agent-1": {"invoke_prefixes": [], "rules": [], "version": 3},
+            "agent-2": {"invoke_prefixes": ["hey mic"], "rules": [], "version": 1},
+        },
+    }
+
+    assert rule_cache.load(snapshot_rule_sets(snapshot)) == 1
+    assert rule_cache._any_gate is None
+
+
+def test_malformed_snapshot_is_ignored(monkeypatch, tmp_path) -> None:
+    path = tmp_path / "rules.json"
+    monkeypatch.setattr(settings, "rule_snapshot_file", str(path))
+    for document in ({"format": 1}, {"format": 1, "agents": {"agent-1": {}}}, {"format": 1, "agents": []}):
+        path.write_text(json.dumps(document), encoding="utf-8")
+        assert load_snapshot_into_cache() == 0
@@ -0,0 +1,23 @@
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ("sqlalchemy", "httpx", "fastapi", "app.db")
+
+
+def _loaded_after_import(module: str) -> list[str]:
+    code = (
+        "import json, sys\n"
+        f"import {module}\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_scheduler_imports_only_queue_dependencies() -> None:
+    assert _loaded_after_import("app.scheduler") == []
+
+
+def test_worker_defers_http_and_engine_setup() -> None:
+    assert _loaded_after_import("app.worker") == ["sqlalchemy"]
@@ -1,11 +1,17 @@
+import asyncio
+
 from fastapi.testclient import TestClient
 
-from app.db import engine
-from app.db_models import Base
+from app.config import settings
+from app.db import SessionLocal, engine
+from app.db_models import Base, InboundDedupRow, OutboundSendRow, PendingDeliveryStatusRow, UserAgentBindingRow
 from app.main import app
 from app.models import AgentRule, RuleAction, RuleType
 from app.queue import InMemoryJobQueue
+from app.repository import Repository
+from app.rule_cache import rule_cache
 from app.runtime import runtime
+from app.worker import handle_job
 
 client = TestClient(app)
 
@@ -13,6 +19,7 @@ client = TestClient(app)
 def setup_function() -> None:
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    rule_cache.invalidate()
     runtime.set_test_queue(InMemoryJobQueue())
 
 
@@ -67,3 +74,127 @@ def test_webhook_processes_message_once() -> None:
     assert isinstance(runtime.queue, InMemoryJobQueue)
     assert len(runtime.queue.items) == 1
     assert runtime.queue.items[0].job_type == "inbound.process_message"
+
+
+def test_webhook_filter_skips_uninvoked_messages(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "webhook_invoke_filter", True)
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "messages": [
+                                {"id": "wamid.10", "from": "15550000010", "type": "text", "text": {"body": "lol"}},
+                                {"id": "wamid.11", "from": "15550000010", "type": "text", "text": {"body": "ok"}},
+                                {
+                                    "id": "wamid.12",
+                                    "from": "15550000011",
+                                    "type": "text",
+                                    "text": {"body": "/ask weather"},
+                                },
+                            ],
+                        }
+                    }
+                ]
+            }
+        ],
+    }
+
+    response = client.post("/webhook", json=payload)
+
+    assert response.json()["processed"] == 1
+    assert response.json()["uninvoked"] == 2
+    assert isinstance(runtime.queue, InMemoryJobQueue)
+    assert [item.payload["message_id"] for item in runtime.queue.items] == ["wamid.12"]
+    with SessionLocal() as session:
+        binding = session.get(UserAgentBindingRow, "15550000010")
+        assert binding is not None
+        assert binding.last_inbound_at is not None
+        assert session.get(InboundDedupRow, "wamid.10") is None
+
+
+def test_webhook_applies_delivery_statuses_in_order() -> None:
+    with SessionLocal() as session:
+        for key, provider_id in (("k1", "wamid.out.1"), ("k2", "wamid.out.2")):
+            session.add(
+                OutboundSendRow(
+                    idempotency_key=key,
+                    wa_id="15550000020",
+                    status="sent",
+                    provider_message_id=provider_id,
+                )
+            )
+        session.commit()
+
+    def status(provider_id: str, value: str, **extra: object) -> dict:
+        return {"id": provider_id, "status": value, "recipient_id": "15550000020", **extra}
+
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "value": {
+                            "statuses": [
+                                status("wamid.out.1", "read"),
+                                status("wamid.out.1", "delivered"),
+                                status("wamid.out.2", "failed", errors=[{"code": 131047, "title": "Re-engagement"}]),
+                                status("wamid.unknown", "delivered"),
+                            ]
+                        }
+                    }
+                ]
+            }
+        ],
+    }
+    late = {
+        "object": "whatsapp_business_account",
+        "entry": [{"changes": [{"value": {"statuses": [status("wamid.out.1", "sent")]}}]}],
+    }
+
+    assert client.post("/webhook", json=payload).json()["statuses"] == 4
+    client.post("/webhook", json=late)
+
+    with SessionLocal() as session:
+        assert session.get(OutboundSendRow, "k1").status == "read"
+        assert session.get(OutboundSendRow, "k2").status == "failed"
+        assert session.get(OutboundSendRow, "k2").last_error == "131047: Re-engagement"
+
+    # The callback for wamid.unknown beat the worker's commit; it is applied once the send is recorded.
+    with SessionLocal() as session:
+        repo = Repository(session)
+        assert repo.try_start_outbound_send("k3", "15550000020", "hi", None, lease_seconds=60, max_attempts=5)
+        repo.mark_outbound_sent("k3", provider_message_id="wamid.unknown")
+        session.commit()
+        assert session.get(OutboundSendRow, "k3").status == "delivered"
+        assert session.get(PendingDeliveryStatusRow, "wamid.unknown") is None
+
+
+def test_webhook_spools_then_sheds_above_high_water_marks(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "queue_depth_check_interval_seconds", 0)
+    monkeypatch.setattr(settings, "queue_spool_high_water", 1)
+    monkeypatch.setattr(settings, "queue_shed_high_water", 2)
+
+    def envelope(message_id: str) -> dict:
+        message = {"id": message_id, "from": "15550000040", "type": "text", "text": {"body": "/ask hi"}}
+        return {"object": "whatsapp_business_account", "entry": [{"changes": [{"value": {"messages": [message]}}]}]}
+
+    assert client.post("/webhook", json=envelope("wamid.40")).json()["status"] == "accepted"
+    assert client.post("/webhook", json=envelope("wamid.41")).json()["status"] == "spooled"
+    shed = client.post("/webhook", json=envelope("wamid.42"))
+    assert shed.status_code == 503
+    assert shed.headers["retry-after"] == "30"
+
+    health = client.get("/health/queue").json()
+    assert health["mode"] == "shed"
+    assert health["depth"] == 2
+    assert health["lanes"]["inbound"]["depth"] == 1
+    assert health["lanes"]["spool"]["depth"] == 1
+
+    assert isinstance(runtime.queue, InMemoryJobQueue)
+    spooled = runtime.queue.items.pop()
+    assert asyncio.run(handle_job(spooled.job_type, spooled.payload)) is True
+    assert [item.payload["message_id"] for item in runtime.queue.items] == ["wamid.40", "wamid.41"]